@@ -1,11 +1,23 @@
 import argparse
+import os
 import sys
+from contextlib import ExitStack
 
 from jogger import __version__ as version
 from jogger.exceptions import TaskDefinitionError
 from jogger.tasks.base import TaskProxy
 from jogger.utils.config import JOG_FILE_NAME, JogConf
+from jogger.utils.eventstream import EventStream
+from jogger.utils.history import (
+    DEFAULT_STATS_LIMIT, HISTORY_FILE_NAME, DurationMonitor, HistoryRecorder,
+    RunHistory, write_plan, write_stats
+)
 from jogger.utils.output import OutputWrapper
+from jogger.utils.profiling import (
+    DEFAULT_MEMORY_PROFILE_LIMIT, DEFAULT_PROFILE_LIMIT, MemoryProfiler,
+    TaskProfiler
+)
+from jogger.utils.trace import TraceRecorder
 
 
 def parse_args(prog, argv=None):
@@ -36,11 +48,191 @@ def parse_args(prog, argv=None):
         help='Display the version number and exit'
     )
     
+    parser.add_argument(
+        '--cprofile',
+        action='store_true',
+        help=(
+            'Profile the task using cProfile and display the top entries,\n'
+            'sorted by cumulative time'
+        )
+    )
+    
+    parser.add_argument(
+        '--cprofile-out',
+        metavar='FILE',
+        help='Write the raw profile data to FILE (pstats format). Implies --cprofile.'
+    )
+    
+    parser.add_argument(
+        '--cprofile-collapsed',
+        metavar='FILE',
+        help=(
+            'Write the profile data to FILE as collapsed stacks, for use with\n'
+            'flame graph tools. Implies --cprofile.'
+        )
+    )
+    
+    parser.add_argument(
+        '--cprofile-limit',
+        metavar='N',
+        type=int,
+        default=DEFAULT_PROFILE_LIMIT,
+        help=f'The number of profile entries to display (default: {DEFAULT_PROFILE_LIMIT})'
+    )
+    
+    parser.add_argument(
+        '--memprofile',
+        action='store_true',
+        help=(
+            'Trace memory allocations made by the task using tracemalloc and\n'
+            'display the peak traced memory and top allocation sites'
+        )
+    )
+    
+    parser.add_argument(
+        '--memprofile-limit',
+        metavar='N',
+        type=int,
+        default=DEFAULT_MEMORY_PROFILE_LIMIT,
+        help=(
+            'The number of allocation sites to display per report section\n'
+            f'(default: {DEFAULT_MEMORY_PROFILE_LIMIT})'
+        )
+    )
+    
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help=(
+            'Write a timeline of the task, any nested tasks, and any executed\n'
+            'commands to FILE, in the Chrome trace event format'
+        )
+    )
+    
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help=(
+            'Display statistics on recent runs of the given task, or all tasks\n'
+            'if no task is given, and exit'
+        )
+    )
+    
+    parser.add_argument(
+        '--stats-runs',
+        metavar='N',
+        type=int,
+        default=DEFAULT_STATS_LIMIT,
+        help=f'The number of recent runs to include in --stats (default: {DEFAULT_STATS_LIMIT})'
+    )
+    
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help=(
+            'Display the steps the given task would run, with estimated\n'
+            'durations based on previous runs, and exit without running it'
+        )
+    )
+    
+    parser.add_argument(
+        '--events',
+        metavar='PATH|FD',
+        help=(
+            'Stream events describing the progress of the task (start/end of\n'
+            'tasks, steps, and commands, and any warnings) to the given file\n'
+            'path or file descriptor number, as JSON lines'
+        )
+    )
+    
     parser.add_argument('extra', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
     
     return parser.parse_args(argv)
 
 
+def execute(task, arguments, stdout, stderr):
+    """
+    Execute the given ``TaskProxy``, recording it in the project's run
+    history and applying any profiling or tracing requested by the given
+    command line ``arguments``.
+    """
+    
+    # Monitor durations before recording the run, so the current run is
+    # not included in the baseline it is compared to
+    monitor = DurationMonitor(task.conf, stdout)
+    instruments = [monitor, HistoryRecorder(task.conf, stderr)]
+    
+    if arguments.events:
+        instruments.append(EventStream(arguments.events))
+    
+    if arguments.trace:
+        instruments.append(TraceRecorder(arguments.trace))
+    
+    if arguments.memprofile:
+        instruments.append(MemoryProfiler(limit=arguments.memprofile_limit))
+    
+    if arguments.cprofile or arguments.cprofile_out or arguments.cprofile_collapsed:
+        instruments.append(TaskProfiler(
+            limit=arguments.cprofile_limit,
+            stats_path=arguments.cprofile_out,
+            collapsed_path=arguments.cprofile_collapsed
+        ))
+    
+    # Report on profiles, etc even if the task exits early, e.g. due to a
+    # TaskError, as that may be exactly what is being investigated
+    try:
+        with ExitStack() as stack:
+            for instrument in instruments:
+                stack.enter_context(instrument)
+            
+            task.execute(passive=False)
+    finally:
+        for instrument in instruments:
+            instrument.report(stdout)
+    
+    if monitor.failed:
+        sys.exit(1)
+
+
+def show_plan(task, stdout):
+    """
+    Display the steps the given ``TaskProxy`` would run, with estimated
+    durations based on the project's run history.
+    """
+    
+    steps = task.get_plan()
+    
+    history = None
+    history_path = os.path.join(task.conf.state_dir, HISTORY_FILE_NAME)
+    if os.path.exists(history_path):
+        history = RunHistory(history_path)
+    
+    try:
+        write_plan(history, stdout, task.name, steps, args=list(task.argv or ()))
+    finally:
+        if history:
+            history.close()
+
+
+def show_stats(conf, task_name, arguments, stdout):
+    """
+    Display statistics on the recorded runs of the given task, or of all
+    tasks if ``task_name`` is empty.
+    """
+    
+    history_path = os.path.join(conf.state_dir, HISTORY_FILE_NAME)
+    if not os.path.exists(history_path):
+        stdout.write('No task runs recorded.')
+        return
+    
+    history = RunHistory(history_path)
+    try:
+        task_names = [task_name] if task_name else None
+        write_stats(history, stdout, task_names, limit=arguments.stats_runs)
+    finally:
+        history.close()
+
+
 def main(argv=None):
     
     prog = 'jog'
@@ -58,14 +250,19 @@ def main(argv=None):
         sys.exit(1)
     
     task_name = arguments.task_name
-    if task_name:
+    if arguments.stats:
+        show_stats(conf, task_name, arguments, stdout)
+    elif task_name:
         try:
             task = tasks[task_name]
         except KeyError:
             stderr.write(f'Unknown task "{task_name}".')
             sys.exit(1)
         
-        task.execute(passive=False)
+        if arguments.plan:
+            show_plan(task, stdout)
+        else:
+            execute(task, arguments, stdout, stderr)
     elif not tasks:
         stdout.write('No tasks defined.')
     else:
@@ -1,13 +1,18 @@
 import argparse
+import copy
 import os
 import re
 import signal
 import subprocess
 import sys
 import tempfile
+import threading
 
 from jogger.exceptions import TaskDefinitionError, TaskError
+from jogger.utils import events
+from jogger.utils.logs import DEFAULT_LOG_MAX_COUNT, open_run_log, rotate_logs
 from jogger.utils.output import OutputWrapper, clean_description
+from jogger.utils.profiling import memory_checkpoint
 
 TASK_NAME_RE = re.compile(r'^\w+$')
 DEFAULT_DESCRIPTION = 'No task description provided. Just guess?'
@@ -19,6 +24,50 @@ DEFAULT_DESCRIPTION = 'No task description provided. Just guess?'
 #
 
 
+def has_fileno(stream):
+    """
+    Return ``True`` if the given stream is backed by a file descriptor that
+    can be passed to a subprocess, and ``False`` otherwise.
+    """
+    
+    try:
+        stream.fileno()
+    except (AttributeError, OSError):  # io.UnsupportedOperation is an OSError
+        return False
+    
+    return True
+
+
+def copy_pipe(pipe, stream):
+    
+    for line in iter(pipe.readline, b''):
+        stream.write(line.decode('utf-8', errors='replace'))
+    
+    stream.flush()
+
+
+def run_piped(cmd, piped, **kwargs):
+    """
+    Run the given command, as per ``subprocess.run()``, copying the output
+    it writes to each pipe (stdout and/or stderr) to the corresponding
+    stream in the ``piped`` dictionary.
+    """
+    
+    with subprocess.Popen(cmd, shell=True, **kwargs) as process:  # noqa: S602
+        threads = []
+        for name, stream in piped.items():
+            thread = threading.Thread(target=copy_pipe, args=(getattr(process, name), stream))
+            thread.start()
+            threads.append(thread)
+        
+        for thread in threads:
+            thread.join()
+        
+        returncode = process.wait()
+    
+    return subprocess.CompletedProcess(args=cmd, returncode=returncode)
+
+
 class BaseTask:
     """
     A base class for controlling configuration and execution of ``jogger`` tasks.
@@ -44,6 +93,10 @@ class BaseTask:
         
         kwargs = vars(options)
         
+        if kwargs['log_dir']:
+            # Write both streams to the same per-run log file
+            kwargs['stdout'] = kwargs['stderr'] = self.open_log(kwargs['log_dir'])
+        
         stdout = kwargs['stdout']
         stderr = kwargs['stderr']
         
@@ -51,7 +104,7 @@ class BaseTask:
         # handle for each so they don't write over the top of each other.
         # Nested tasks may have already performed this step, so also ensure
         # the handles aren't already the same.
-        if stdout.name == stderr.name and stdout is not stderr:
+        if stdout is not stderr and stdout.name == stderr.name:
             stderr.close()
             kwargs['stderr'] = stderr = stdout
         
@@ -97,6 +150,16 @@ class BaseTask:
             default=default_stderr
         )
         
+        parser.add_argument(
+            '--log-dir',
+            help=(
+                'Write all output, from both stdout and stderr, to a new\n'
+                'compressed log file in the given directory, removing old\n'
+                'log files as configured by the log_max_count and\n'
+                'log_max_size settings.'
+            )
+        )
+        
         parser.add_argument(
             '--no-color',
             action='store_true',
@@ -107,6 +170,32 @@ class BaseTask:
         
         return parser
     
+    def open_log(self, log_dir):
+        """
+        Create a new log file for this run of the task in the given directory,
+        compressed as configured by the ``log_compression`` setting, and
+        return a text stream for writing to it. Remove any old log files
+        exceeding the limits of the ``log_max_count`` and ``log_max_size``
+        settings.
+        """
+        
+        settings = self.settings
+        
+        try:
+            max_count = int(settings.get('log_max_count', DEFAULT_LOG_MAX_COUNT))
+            max_size = int(settings.get('log_max_size', 0))
+        except ValueError:
+            raise TaskDefinitionError('Invalid value for log_max_count or log_max_size setting.')
+        
+        try:
+            stream = open_run_log(log_dir, self.name, settings.get('log_compression'))
+        except ValueError as e:
+            raise TaskDefinitionError(str(e))
+        
+        rotate_logs(log_dir, self.name, max_count, max_size)
+        
+        return stream
+    
     def add_arguments(self, parser):
         """
         Custom tasks should override this method to add any custom command line
@@ -124,7 +213,7 @@ class BaseTask:
         
         return self._settings
     
-    def cli(self, cmd, capture=False):
+    def cli(self, cmd, capture=False, env=None):
         """
         Run a command on the system's command line, in the context of the task's
         :attr:`~Task.stdout` and :attr:`~Task.stderr` output streams. Output
@@ -133,10 +222,14 @@ class BaseTask:
         :param cmd: The command string to execute.
         :param capture: ``True`` to capture all output from the command rather
             than writing it to the configured output streams.
+        :param env: An optional dictionary of environment variables to set for
+            the command, in addition to those of the current process.
         :return: The command result object.
         """
         
         kwargs = {}
+        piped = {}
+        
         if capture:
             kwargs['capture_output'] = True
         else:
@@ -146,13 +239,38 @@ class BaseTask:
             
             if not self.using_system_err:
                 kwargs['stderr'] = self.kwargs['stderr']
+            
+            # Streams without a file descriptor (e.g. compressed run logs)
+            # cannot be passed to the subprocess directly. Pipe the output
+            # through them instead.
+            for name, stream in kwargs.items():
+                if not has_fileno(stream):
+                    piped[name] = stream
+                    kwargs[name] = subprocess.PIPE
+            
+            # Merge output destined for the same stream into a single pipe,
+            # to preserve its order
+            if 'stderr' in piped and piped['stderr'] is piped.get('stdout'):
+                kwargs['stderr'] = subprocess.STDOUT
+                del piped['stderr']
+        
+        if env:
+            kwargs['env'] = {**os.environ, **{name: str(value) for name, value in env.items()}}
+        
+        with events.span('command', task=self.name, command=cmd) as span:
+            try:
+                if piped:
+                    result = run_piped(cmd, piped, **kwargs)
+                else:
+                    result = subprocess.run(cmd, shell=True, **kwargs)  # noqa: S602
+            except KeyboardInterrupt:
+                # Don't show any errors on a KeyboardInterrupt - it may be expected
+                # to end the running process
+                result = subprocess.CompletedProcess(args=cmd.split(), returncode=-(signal.SIGINT))
+            
+            span['returncode'] = result.returncode
         
-        try:
-            return subprocess.run(cmd, shell=True, **kwargs)  # noqa: S602
-        except KeyboardInterrupt:
-            # Don't show any errors on a KeyboardInterrupt - it may be expected
-            # to end the running process
-            return subprocess.CompletedProcess(args=cmd.split(), returncode=-(signal.SIGINT))
+        return result
     
     def execute(self):
         """
@@ -260,6 +378,94 @@ class Task(BaseTask):
         
         return content
     
+    def step(self, name):
+        """
+        Return a context manager marking the code within it as a distinct step
+        of the task, e.g.::
+        
+            with self.step('migrate') as step:
+                result = self.cli('python manage.py migrate')
+                step['outcome'] = result.returncode == 0
+        
+        The start and end of the step are reported to any interested parties,
+        such as the run history used by ``jog --stats``. The context manager
+        yields a dictionary that can be used to report additional details on
+        the step, including its ``outcome``: ``True`` for success, ``False``
+        for failure, or ``None`` if it was skipped. Steps that waited for user
+        input should also set ``interactive`` to ``True``, so that their
+        durations are not recorded or compared to previous runs.
+        
+        :param name: The name of the step.
+        :return: The context manager.
+        """
+        
+        return events.span('step', task=self.name, step=name)
+    
+    def get_plan(self, *args, **kwargs):
+        """
+        Return the names of the steps the task would run, given the provided
+        arguments, in the order they would run. Used to preview the task via
+        ``jog --plan``. Tasks that report their steps via :meth:`step` should
+        override this method to describe them. By default, return an empty
+        list, indicating the task has no distinct steps.
+        
+        :return: A list of step names.
+        """
+        
+        return []
+    
+    def progress(self, label):
+        """
+        Return a context manager for reporting the progress of a long-running
+        operation, such as scanning a large number of files, to ``stdout``.
+        See :class:`~jogger.utils.output.Progress`.
+        
+        :param label: A label describing the operation, e.g. ``'Scanned'``.
+        :return: The ``Progress`` instance.
+        """
+        
+        return self.stdout.progress(label)
+    
+    def get_buffered_copy(self, buffer):
+        """
+        Return a shallow copy of the task that writes all output, including
+        that of any executed commands, to the given
+        :class:`~jogger.utils.output.OutputBuffer`. Useful for running parts
+        of a task concurrently, in separate threads, while still displaying
+        the output of each as a single block.
+        
+        :param buffer: The ``OutputBuffer`` instance.
+        :return: The copy of the task.
+        """
+        
+        task = copy.copy(self)
+        
+        stdout = buffer.get_stream(self.stdout._out)
+        stderr = buffer.get_stream(self.stderr._out)
+        task.kwargs = {**self.kwargs, 'stdout': stdout, 'stderr': stderr}
+        task.using_system_out = task.using_system_err = False
+        
+        # Retain the styles of the original streams, as the buffered streams
+        # can't tell whether they are supported
+        task.stdout = OutputWrapper(stdout)
+        task.stdout.styler = self.stdout.styler
+        task.stderr = OutputWrapper(stderr, default_style='error')
+        task.stderr.styler = self.stderr.styler
+        
+        return task
+    
+    def memory_checkpoint(self, label):
+        """
+        Record a named snapshot of the memory allocated by the task, for
+        comparison with other checkpoints when memory profiling is enabled
+        via ``jog --memprofile``. Does nothing if memory profiling is not
+        enabled.
+        
+        :param label: A label identifying the checkpoint in the report.
+        """
+        
+        memory_checkpoint(label)
+    
     def get_task_proxy(self, task_name, *args):
         """
         Return an object representing the task matching the given name,
@@ -388,14 +594,35 @@ class TaskProxy:
         
         return f'{name}: {description}\n    See "{self.prog} --help" for usage details'
     
-    def execute(self, passive=True):
+    def get_task(self):
+        """
+        Return an instance of the appropriate task class, configured for
+        this task.
+        """
         
         common_args = (self.prog, self.name, self.conf, self.stdout, self.stderr, self.argv)
         
         if self.simple:
-            task = SimpleTask(self.task, *common_args)
-        else:
-            task = self.task(*common_args)
+            return SimpleTask(self.task, *common_args)
+        
+        return self.task(*common_args)
+    
+    def get_plan(self):
+        """
+        Return the names of the steps the task would run, in order, without
+        running it. Tasks without distinct steps return an empty list.
+        """
+        
+        if self.simple:
+            return []
+        
+        task = self.get_task()
+        
+        return task.get_plan(*task.args, **task.kwargs)
+    
+    def execute(self, passive=True):
+        
+        task = self.get_task()
         
         # Invoke handle() instead of execute() when in "passive" mode. This
         # is typically for when calling from within another task, as execute()
@@ -403,7 +630,8 @@ class TaskProxy:
         # for a nested task. Passive mode leaves the calling task the option
         # of manually handling such exceptions if necessary, and its own
         # execute() method will deal with them if left uncaught.
-        if passive:
-            task.handle(*task.args, **task.kwargs)
-        else:
-            task.execute()
+        with events.span('task', task=self.name, args=list(self.argv or ())):
+            if passive:
+                task.handle(*task.args, **task.kwargs)
+            else:
+                task.execute()
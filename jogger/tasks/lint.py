@@ -1,9 +1,24 @@
+import functools
+import json
 import os
-from collections import OrderedDict
+import shlex
+import threading
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from stat import S_ISREG
 
-from jogger.utils.files import walk
+from jogger.utils.config import STATE_DIR_NAME
+from jogger.utils.endings import (
+    BINARY_SNIFF_SIZE, DEFAULT_DETAIL_LINES, ENDINGS, analyse_endings,
+    find_bad_ending, fix_endings, is_binary
+)
+from jogger.utils.files import FILE_INDEX_NAME, FileIndex, filter_paths, scan
+from jogger.utils.git import DEFAULT_BRANCH_NAME, find_changed_files, list_files
+from jogger.utils.output import OutputBuffer
 
 from .base import Task, TaskError
+from .django import configure_django
 
 try:
     import ruff  # noqa: F401
@@ -18,21 +33,21 @@ except ImportError:
     HAS_ISORT = False
 
 try:
-    from django.core.management import call_command  # noqa: F401
+    from django.core.management import call_command
+    from django.core.management.base import CommandError, SystemCheckError
     HAS_DJANGO = True
 except ImportError:
     HAS_DJANGO = False
 
-ENDINGS = {
-    'CRLF': b'\r\n',
-    'CR': b'\r',
-    'LF': b'\n'
-}
-
 DEFAULT_GOOD_ENDING = 'LF'
+BINARY_RESULT = 'binary'
 DEFAULT_MAX_FILESIZE = 1024 * 1024  # 1MB in bytes
 DEFAULT_SYSCHECK_FAIL_LEVEL = 'WARNING'
 
+# Guards configuring Django in-process, which may be requested by multiple
+# steps running concurrently
+_django_setup_lock = threading.Lock()
+
 
 class LintTask(Task):
     
@@ -55,6 +70,7 @@ class LintTask(Task):
         super().__init__(*args, **kwargs)
         
         self.outcomes = OrderedDict()
+        self.changed_files = None  # all files
     
     def add_arguments(self, parser):
         
@@ -65,8 +81,79 @@ class LintTask(Task):
                 dest=f'do_{name}',
                 help=help_text
             )
+        
+        parser.add_argument(
+            '--parallel',
+            action='store_true',
+            help=(
+                'Run the steps concurrently. The output of each step is still\n'
+                'displayed in order, once it is complete.'
+            )
+        )
+        
+        changed_group = parser.add_mutually_exclusive_group()
+        
+        changed_group.add_argument(
+            '--changed',
+            nargs='?',
+            const='',
+            metavar='REF',
+            help=(
+                'Only lint files changed since the given git reference,\n'
+                'including uncommitted and untracked files. Defaults to the\n'
+                'merge base with the branch given by the branch_name setting,\n'
+                'or "main".'
+            )
+        )
+        
+        changed_group.add_argument(
+            '--staged',
+            action='store_true',
+            help='Only lint files with changes staged in the git index.'
+        )
+        
+        parser.add_argument(
+            '--fable-detail',
+            action='store_true',
+            help=(
+                'Report the number of line endings of each type in any files\n'
+                'flagged by the fable step, and the line numbers of the first\n'
+                'bad endings.'
+            )
+        )
+        
+        parser.add_argument(
+            '--fable-report',
+            metavar='FILE',
+            help=(
+                'Write the details of any files flagged by the fable step to\n'
+                'the given file, as JSON lines.'
+            )
+        )
+        
+        parser.add_argument(
+            '--fable-fix',
+            action='store_true',
+            help=(
+                'Convert any bad line endings found in the fable step to the\n'
+                'configured good line ending.'
+            )
+        )
+        
+        parser.add_argument(
+            '-j', '--jobs',
+            type=int,
+            help=(
+                'The number of files to check concurrently in the fable step.\n'
+                'Defaults to the fable_workers setting, or 1.'
+            )
+        )
     
-    def handle(self, **options):
+    def get_steps(self, options):
+        """
+        Return the steps to run based on the given options, and whether they
+        were explicitly requested, as a ``(steps, explicit)`` tuple.
+        """
         
         settings = self.settings
         
@@ -82,14 +169,44 @@ class LintTask(Task):
                 implicit_steps.append(step)
         
         if explicit_steps:
-            run = explicit_steps
-            explicit = True
-        else:
-            run = implicit_steps
-            explicit = False
+            return explicit_steps, True
         
-        for step in run:
-            getattr(self, f'handle_{step}')(explicit)
+        return implicit_steps, False
+    
+    def get_plan(self, **options):
+        
+        steps = self.get_steps(options)[0]
+        
+        # Exclude steps that would be skipped when run, due to the necessary
+        # tools being unavailable or there being no changed Python files
+        try:
+            self.changed_files = self.get_changed_files(options)
+        except TaskError:
+            pass  # reported when the task is run
+        
+        no_python_files = self.get_python_files() == []
+        
+        skipped = set()
+        if no_python_files or not (HAS_ISORT or HAS_RUFF):
+            skipped.add('python')
+        
+        if no_python_files or not HAS_DJANGO:
+            skipped.update(('migrations', 'syschecks'))
+        
+        return [step for step in steps if step not in skipped]
+    
+    def handle(self, **options):
+        
+        run, explicit = self.get_steps(options)
+        
+        self.changed_files = self.get_changed_files(options)
+        
+        parallel = options['parallel'] or self.settings.get('parallel', False)
+        if parallel and len(run) > 1:
+            self.run_steps_parallel(run, explicit)
+        else:
+            for step in run:
+                self.run_step(step, explicit)
         
         summary = []
         for label, result in self.outcomes.items():
@@ -104,28 +221,125 @@ class LintTask(Task):
             self.stdout.write('Summary', style='label')
             self.stdout.write('\n'.join(summary))
     
+    def get_changed_files(self, options):
+        """
+        Return the paths of the files to lint when using the ``--changed`` or
+        ``--staged`` arguments, as reported by git. Return ``None`` if neither
+        argument was given, indicating all files should be linted.
+        """
+        
+        ref = options['changed']
+        staged = options['staged']
+        
+        if ref is None and not staged:
+            return None
+        
+        branch_name = self.settings.get('branch_name', DEFAULT_BRANCH_NAME)
+        
+        try:
+            return find_changed_files('./', ref, branch_name, staged)
+        except ValueError as e:
+            raise TaskError(str(e))
+    
+    def get_python_files(self):
+        """
+        Return the paths of the changed Python files when using the
+        ``--changed`` or ``--staged`` arguments, or ``None`` if linting all
+        files.
+        """
+        
+        if self.changed_files is None:
+            return None
+        
+        return [path for path in self.changed_files if path.endswith('.py')]
+    
+    def run_step(self, step, explicit):
+        
+        with self.step(step) as result:
+            previous_outcomes = set(self.outcomes)
+            getattr(self, f'handle_{step}')(explicit)
+            
+            # Steps may record multiple outcomes (or none, if skipped)
+            step_outcomes = {k: v for k, v in self.outcomes.items() if k not in previous_outcomes}
+            result['outcomes'] = step_outcomes
+            result['outcome'] = all(step_outcomes.values()) if step_outcomes else None
+    
+    def get_buffered_copy(self, buffer):
+        
+        task = super().get_buffered_copy(buffer)
+        
+        # Record outcomes separately, to be merged in step order
+        task.outcomes = OrderedDict()
+        
+        return task
+    
+    def run_steps_parallel(self, steps, explicit):
+        """
+        Run the given steps concurrently, each in its own thread, buffering
+        their output. Write the output of each step, and record its outcomes,
+        in the order the steps would run sequentially.
+        """
+        
+        buffers = [OutputBuffer() for _ in steps]
+        tasks = [self.get_buffered_copy(buffer) for buffer in buffers]
+        
+        with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix='lint') as executor:
+            futures = [
+                executor.submit(task.run_step, step, explicit)
+                for task, step in zip(tasks, steps)
+            ]
+            
+            for task, buffer, future in zip(tasks, buffers, futures):
+                try:
+                    future.result()
+                finally:
+                    buffer.flush()
+                
+                self.outcomes.update(task.outcomes)
+    
     def handle_python(self, explicit):
         
-        if explicit and not HAS_ISORT and not HAS_RUFF:
-            self.stderr.write('Cannot lint python: Neither isort nor ruff are available.')
+        if not HAS_ISORT and not HAS_RUFF:
+            if explicit:
+                self.stderr.write('Cannot lint python: Neither isort nor ruff are available.')
+            
             return
         
+        isort_cmd = 'isort --check-only --diff'
+        ruff_cmd = 'ruff check'
+        
+        paths = self.get_python_files()
+        if paths is None:
+            target = '.'
+        elif not paths:
+            self.stdout.write('No changed Python files to lint\n')
+            return
+        else:
+            # Explicitly passed files must still respect each tool's
+            # configured exclusions
+            target = shlex.join(paths)
+            isort_cmd = f'{isort_cmd} --filter-files'
+            ruff_cmd = f'{ruff_cmd} --force-exclude'
+        
         if HAS_ISORT:
             self.stdout.write('Running isort...', style='label')
-            result = self.cli('isort --check-only --diff .')
+            result = self.cli(f'{isort_cmd} {target}')
             self.outcomes['isort'] = result.returncode == 0
             self.stdout.write('')  # newline
         
         if HAS_RUFF:
             self.stdout.write('Running ruff...', style='label')
-            result = self.cli('ruff check .')
+            result = self.cli(f'{ruff_cmd} {target}')
             self.outcomes['ruff'] = result.returncode == 0
             self.stdout.write('')  # newline
     
     def _get_fable_excludes(self):
         
         # Start with some sane default exclusions
-        excludes = {'.git', '__pycache__', '*.pyc', '*.pdf', '*.png', '*.jpg', '*.jpeg', '*.gif'}
+        excludes = {
+            '.git', STATE_DIR_NAME, '__pycache__',
+            '*.pyc', '*.pdf', '*.png', '*.jpg', '*.jpeg', '*.gif'
+        }
         
         # Add any configured excludes
         try:
@@ -135,6 +349,15 @@ class LintTask(Task):
         
         return excludes
     
+    def _get_int_setting(self, name, default):
+        
+        value = self.settings.get(name, default)
+        
+        try:
+            return int(value)
+        except ValueError:
+            raise TaskError(f'Invalid value for {name} setting ({value}).')
+    
     def handle_fable(self, explicit):
         
         self.stdout.write('Running fable...', style='label')
@@ -146,38 +369,309 @@ class LintTask(Task):
         if good_ending not in ENDINGS:
             raise TaskError(f'Invalid value for fable_good_endings setting ({good_ending}).')
         
-        # Compile inverse dictionary of bad line endings
-        bad_endings = {v: k for k, v in ENDINGS.items() if k != good_ending}
+        # Get the maximum file size to analyse (0 for no maximum), and the
+        # number of threads to read directories and files with, from settings
+        max_filesize = self._get_int_setting('fable_max_filesize', DEFAULT_MAX_FILESIZE)
+        walk_workers = self._get_int_setting('fable_walk_workers', 1)
+        workers = self.kwargs['jobs'] or self._get_int_setting('fable_workers', 1)
+        skip_binary = self.settings.get('fable_skip_binary', True)
         
-        # Get the maximum file size to analyse from settings
-        max_filesize = self.settings.get('fable_max_filesize', DEFAULT_MAX_FILESIZE)
+        # Unless disabled, reuse the results of previous runs for files that
+        # haven't changed. Any change to the settings affecting the results
+        # forces all files to be checked again.
+        index = self.get_fable_index({
+            'root': os.getcwd(),
+            'excludes': sorted(excludes),
+            'good_ending': good_ending,
+            'max_filesize': max_filesize,
+            'skip_binary': skip_binary
+        })
         
-        try:
-            max_filesize = int(max_filesize)
-        except ValueError:
-            raise TaskError(f'Invalid value for fable_max_filesize setting ({max_filesize}).')
+        detected_files = []
+        counts = dict.fromkeys(('unchanged', 'skipped', 'binary'), 0)
+        check = functools.partial(self.check_endings, good_ending=good_ending, skip_binary=skip_binary)
         
-        result = True
-        skipped = 0
-        for filename in walk('./', excludes):
-            if os.path.getsize(filename) > max_filesize:
-                skipped += 1
-                continue
+        # Check files concurrently if using multiple workers, but always
+        # report them in the order they were found. Limit the number of
+        # pending checks so results don't accumulate in memory.
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        pending = deque()
+        max_pending = workers * 4
+        
+        try:
+            with self.progress('Scanned') as progress:
+                for filename, stat in self.get_fable_files(excludes, walk_workers):
+                    if max_filesize and stat.st_size > max_filesize:
+                        counts['skipped'] += 1
+                        progress.update()
+                        continue
+                    
+                    pending.append((filename, stat, *self.get_fable_result(filename, stat, check, index, executor)))
+                    if len(pending) >= max_pending:
+                        self.record_fable_result(pending.popleft(), index, progress, counts, detected_files)
+                
+                while pending:
+                    self.record_fable_result(pending.popleft(), index, progress, counts, detected_files)
             
-            with open(filename, 'rb') as f:
-                content = f.read()
-                for ending in bad_endings:
-                    if ending in content:
-                        self.stdout.write(f'Detected {bad_endings[ending]}: {filename}')
-                        result = False
-                        break
+            result = not detected_files
+            if detected_files and (self.kwargs['fable_detail'] or self.kwargs['fable_report']):
+                self.report_fable_details(detected_files, good_ending, executor)
+            
+            if detected_files and self.kwargs['fable_fix']:
+                result = self.fix_fable_files(detected_files, good_ending, executor, index)
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        
+        if index:
+            self.save_fable_index(index)
         
-        if skipped:
-            self.stdout.write(f'Skipped {skipped} large files')
+        self.write_fable_summary(counts)
         
         self.outcomes['fable'] = result
         self.stdout.write('')  # newline
     
+    def get_fable_result(self, filename, stat, check, index, executor):
+        """
+        Return a ``(future, reused)`` tuple for the fable check of the given
+        file. If the index holds a result for the file, unchanged since it
+        was stored, the future is already resolved with it. Otherwise, the
+        file is checked using ``check``, via the given executor, if any.
+        """
+        
+        if index:
+            try:
+                detected = index.get(filename, stat)
+            except KeyError:
+                pass
+            else:
+                future = Future()
+                future.set_result(detected)
+                return future, True
+        
+        if executor:
+            return executor.submit(check, filename), False
+        
+        future = Future()
+        future.set_result(check(filename))
+        
+        return future, False
+    
+    def record_fable_result(self, entry, index, progress, counts, detected_files):
+        """
+        Wait for the result of the given pending fable check, a
+        ``(filename, stat, future, reused)`` tuple, and record it: in the
+        index, the progress report, the given ``counts``, and the list of
+        ``detected_files``, as appropriate.
+        """
+        
+        filename, stat, future, reused = entry
+        detected = future.result()
+        
+        if reused:
+            counts['unchanged'] += 1
+            progress.update()
+        else:
+            if index:
+                index.set(filename, stat, detected)
+            
+            # Only the first block of binary files is read
+            size = stat.st_size
+            if detected == BINARY_RESULT:
+                size = min(size, BINARY_SNIFF_SIZE)
+            
+            progress.update(size=size)
+        
+        if detected == BINARY_RESULT:
+            counts['binary'] += 1
+        elif detected:
+            self.stdout.write(f'Detected {detected}: {filename}')
+            detected_files.append(filename)
+    
+    def save_fable_index(self, index):
+        
+        # Only the changed files are seen when using --changed or --staged,
+        # so keep the results of all others
+        try:
+            index.save(prune=self.changed_files is None)
+        except OSError as e:
+            self.stderr.write(f'Could not save fable index: {e}', style='warning')
+    
+    def write_fable_summary(self, counts):
+        
+        if counts['unchanged']:
+            self.stdout.write(f'Reused previous results for {counts["unchanged"]} unchanged files')
+        
+        if counts['skipped']:
+            self.stdout.write(f'Skipped {counts["skipped"]} large files')
+        
+        if counts['binary']:
+            self.stdout.write(f'Skipped {counts["binary"]} binary files')
+    
+    def get_fable_index(self, signature):
+        """
+        Return the ``FileIndex`` used to reuse the results of previous fable
+        runs, with the given signature, or ``None`` if it is disabled via the
+        ``fable_index`` setting or the state directory cannot be created (e.g.
+        in a read-only checkout).
+        """
+        
+        if not self.settings.get('fable_index', True):
+            return None
+        
+        try:
+            path = self.conf.get_state_path(FILE_INDEX_NAME)
+        except OSError as e:
+            self.stderr.write(f'Could not use fable index: {e}', style='warning')
+            return None
+        
+        return FileIndex(path, consumer='fable', signature=signature)
+    
+    def report_fable_details(self, filenames, good_ending, executor):
+        """
+        Analyse the line endings in the given files, using the given executor,
+        if any. Write the details to ``stdout`` if using ``--fable-detail``,
+        and to the file given by ``--fable-report``, if any.
+        """
+        
+        max_lines = self._get_int_setting('fable_detail_lines', DEFAULT_DETAIL_LINES)
+        
+        def analyse(filename):
+            
+            with open(filename, 'rb') as f:
+                return analyse_endings(f, good_ending, max_lines)
+        
+        if executor:
+            results = executor.map(analyse, filenames)
+        else:
+            results = map(analyse, filenames)
+        
+        show = self.kwargs['fable_detail']
+        report_path = self.kwargs['fable_report']
+        report = open(report_path, 'w') if report_path else None
+        
+        if show:
+            self.stdout.write('\nLine ending details', style='label')
+        
+        try:
+            for filename, (counts, lines) in zip(filenames, results):
+                if report:
+                    record = {'path': filename, 'good_ending': good_ending, 'counts': counts, 'lines': lines}
+                    report.write(f'{json.dumps(record)}\n')
+                
+                if show:
+                    self.write_fable_detail(filename, counts, lines)
+        finally:
+            if report:
+                report.close()
+        
+        if report_path:
+            self.stdout.write(f'\nDetails written to: {report_path}')
+    
+    def write_fable_detail(self, filename, counts, lines):
+        
+        self.stdout.write(filename)
+        
+        for name, count in counts.items():
+            line_numbers = lines.get(name)
+            if count and line_numbers:
+                label = 'line' if count == 1 else 'lines'
+                more = ', ...' if count > len(line_numbers) else ''
+                line_numbers = ', '.join(str(n) for n in line_numbers)
+                self.stdout.write(f'    {name}: {count} ({label} {line_numbers}{more})')
+            else:
+                self.stdout.write(f'    {name}: {count}')
+    
+    def fix_fable_files(self, filenames, good_ending, executor, index):
+        """
+        Convert all line endings in the given files to ``good_ending``, using
+        the given executor, if any. Return ``True`` if all files were fixed
+        successfully, ``False`` otherwise.
+        """
+        
+        self.stdout.write(f'\nFixing line endings (converting to {good_ending})...', style='label')
+        
+        def fix(filename):
+            
+            try:
+                return fix_endings(filename, good_ending)
+            except OSError as e:
+                return e
+        
+        if executor:
+            results = executor.map(fix, filenames)
+        else:
+            results = map(fix, filenames)
+        
+        success = True
+        for filename, counts in zip(filenames, results):
+            if isinstance(counts, OSError):
+                self.stderr.write(f'Could not fix {filename}: {counts}')
+                success = False
+                continue
+            
+            converted = ', '.join(f'{count} {name}' for name, count in counts.items() if count)
+            self.stdout.write(f'Fixed {filename} (converted {converted})')
+            
+            if index:
+                index.set(filename, os.stat(filename), None)
+        
+        return success
+    
+    def get_fable_files(self, excludes, walk_workers):
+        """
+        Yield a ``(path, stat)`` tuple for each file to be checked by fable,
+        from the source configured by the ``fable_source`` setting: a walk
+        of the filesystem (the default), or the files known to git. When using
+        the ``--changed`` or ``--staged`` arguments, only changed files are
+        yielded.
+        """
+        
+        source = self.settings.get('fable_source', 'walk')
+        if source not in ('walk', 'git'):
+            raise TaskError(f'Invalid value for fable_source setting ({source}).')
+        
+        paths = self.changed_files
+        if paths is None and source == 'git':
+            paths = list_files('./', untracked=self.settings.get('fable_untracked', False))
+            if paths is None and self.kwargs['verbosity'] > 1:
+                self.stdout.write('Not a git repository, checking all files')
+        
+        if paths is None:
+            for entry in scan('./', excludes, workers=walk_workers):
+                yield entry.path, entry.stat()
+            
+            return
+        
+        for path in filter_paths(paths, excludes):
+            # Tracked files may have been deleted from the working tree, and
+            # submodules are listed as directories
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            
+            if S_ISREG(stat.st_mode):
+                yield path, stat
+    
+    def check_endings(self, filename, good_ending, skip_binary=False):
+        """
+        Return the name of the first line ending other than ``good_ending``
+        found in the given file, or ``None`` if none were found. If
+        ``skip_binary`` is ``True``, first check whether the file appears to
+        be binary, based on its first block of content, and return
+        ``'binary'`` without checking it further if so.
+        """
+        
+        with open(filename, 'rb') as f:
+            if skip_binary:
+                if is_binary(f.read(BINARY_SNIFF_SIZE)):
+                    return BINARY_RESULT
+                
+                f.seek(0)
+            
+            return find_bad_ending(f, good_ending)
+    
     def handle_migrations(self, explicit):
         
         if explicit and not HAS_DJANGO:
@@ -185,11 +679,19 @@ class LintTask(Task):
             return
         
         if HAS_DJANGO:
+            if self.get_python_files() == []:
+                self.stdout.write('No changed Python files, skipping migration check\n')
+                return
+            
             self.stdout.write('Checking for missing migrations...', style='label')
             
-            result = self.cli('python manage.py makemigrations --dry-run --check --skip-checks')
+            if self.settings.get('django_settings_module'):
+                success = self.call_django_command('makemigrations', dry_run=True, check=True, skip_checks=True)
+            else:
+                result = self.cli('python manage.py makemigrations --dry-run --check --skip-checks')
+                success = result.returncode == 0
             
-            self.outcomes['migrations'] = result.returncode == 0
+            self.outcomes['migrations'] = success
             self.stdout.write('')  # newline
     
     def handle_syschecks(self, explicit):
@@ -199,10 +701,62 @@ class LintTask(Task):
             return
         
         if HAS_DJANGO:
+            if self.get_python_files() == []:
+                self.stdout.write('No changed Python files, skipping system checks\n')
+                return
+            
             self.stdout.write('Running Django system checks...', style='label')
             
             fail_level = self.settings.get('syschecks_fail_level', DEFAULT_SYSCHECK_FAIL_LEVEL)
-            result = self.cli(f'python manage.py check --fail-level {fail_level}')
+            if self.settings.get('django_settings_module'):
+                success = self.call_django_command('check', fail_level=fail_level)
+            else:
+                result = self.cli(f'python manage.py check --fail-level {fail_level}')
+                success = result.returncode == 0
             
-            self.outcomes['syschecks'] = result.returncode == 0
+            self.outcomes['syschecks'] = success
             self.stdout.write('')  # newline
+    
+    def setup_django(self):
+        """
+        Configure Django in the current process, using the settings module
+        given by the ``django_settings_module`` setting, unless it has
+        already been configured.
+        """
+        
+        from django.apps import apps
+        
+        with _django_setup_lock:
+            if not apps.ready:
+                configure_django(self.conf.project_dir, self.settings['django_settings_module'])
+    
+    def call_django_command(self, name, **options):
+        """
+        Run the given Django management command in the current process,
+        writing its output to the task's output streams. Errors are reported
+        in the same way as when running the command via ``manage.py``.
+        
+        :param name: The name of the management command.
+        :param options: Options to pass to the command.
+        :return: ``True`` if the command succeeded, ``False`` otherwise, as
+            per the exit status of the equivalent ``manage.py`` call.
+        """
+        
+        try:
+            self.setup_django()
+            call_command(name, stdout=self.kwargs['stdout'], stderr=self.kwargs['stderr'], **options)
+        except SystemExit as e:
+            # E.g. makemigrations --check exits with a status of 1 if changes
+            # are detected
+            return not e.code
+        except SystemCheckError as e:
+            self.stderr.write(str(e), style='normal')
+            return False
+        except CommandError as e:
+            self.stderr.write(f'{e.__class__.__name__}: {e}', style='normal')
+            return False
+        except Exception:
+            self.stderr.write(traceback.format_exc().strip(), style='normal')
+            return False
+        
+        return True
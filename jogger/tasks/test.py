@@ -1,5 +1,23 @@
 import argparse
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from jogger.utils.config import STATE_DIR_NAME
+from jogger.utils.failures import (
+    FAILURES_FILE_NAME, RESULTS_ENV_VAR, filter_failures, load_failures,
+    load_results, save_failures
+)
+from jogger.utils.files import FileIndex, get_matcher
+from jogger.utils.git import DEFAULT_BRANCH_NAME, find_changed_files
+from jogger.utils.imports import (
+    IMPORT_GRAPH_CONSUMER, IMPORT_INDEX_NAME, ImportGraph, get_module_name
+)
+from jogger.utils.output import OutputBuffer
+from jogger.utils.shards import (
+    DURATIONS_ENV_VAR, DURATIONS_FILE_NAME, SHARD_ENV_VAR,
+    discover_test_modules, load_durations, save_durations, split_modules
+)
 
 from .base import Task, TaskError
 
@@ -21,6 +39,36 @@ try:
 except ImportError:
     HAS_TBLIB = False
 
+# Changes to files matching these patterns may affect any test, so cause all
+# tests to be run when using --affected
+DEFAULT_AFFECTED_FULL_SUITE = (
+    '*settings*.py', '*/settings/*', '*/migrations/*', 'conftest.py',
+    'manage.py', 'requirements*.txt'
+)
+
+# Directories never searched for Python modules when building the import
+# graph for --affected, including common virtual environment locations
+DEFAULT_AFFECTED_EXCLUDE = (
+    '.git', STATE_DIR_NAME, '__pycache__', 'node_modules', '.venv', 'venv',
+    '.tox', '.nox', 'site-packages', 'dist-packages'
+)
+
+
+def shard_spec(value):
+    """
+    Parse a shard specification of the form ``K/N`` into a ``(K, N)`` tuple.
+    """
+    
+    try:
+        index, count = (int(v) for v in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Invalid shard "{value}", expected K/N, e.g. 1/4.')
+    
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f'Invalid shard "{value}", K must be between 1 and N.')
+    
+    return index, count
+
 
 class TestTask(Task):
     
@@ -108,6 +156,63 @@ class TestTask(Task):
             )
         )
         
+        shard_group = parser.add_mutually_exclusive_group()
+        
+        shard_group.add_argument(
+            '--shard',
+            type=shard_spec,
+            metavar='K/N',
+            help=(
+                'Run only the Kth of N slices of the test suite, e.g. 1/4. '
+                'Slices are balanced using the recorded durations of each '
+                'test module, where available.'
+            )
+        )
+        
+        shard_group.add_argument(
+            '--shards',
+            type=int,
+            metavar='N',
+            help=(
+                'Split the test suite into N slices and run them all at '
+                'once, in separate processes, then combine the results.'
+            )
+        )
+        
+        parser.add_argument(
+            '--affected',
+            nargs='?',
+            const='',
+            metavar='REF',
+            help=(
+                'Only run tests affected by the files changed since the given '
+                'git reference. Defaults to the merge base with the branch '
+                'given by the branch_name setting, or "main".'
+            )
+        )
+        
+        failed_group = parser.add_mutually_exclusive_group()
+        
+        failed_group.add_argument(
+            '--last-failed',
+            action='store_true',
+            dest='last_failed',
+            help=(
+                'Only run the tests that failed the last time they were run. '
+                'If no failures are recorded, run all tests.'
+            )
+        )
+        
+        failed_group.add_argument(
+            '--failed-first',
+            action='store_true',
+            dest='failed_first',
+            help=(
+                'Run the tests that failed the last time they were run before '
+                'the rest of the tests.'
+            )
+        )
+        
         parser.add_argument('extra', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
     
     def verify_arguments(self, options):
@@ -121,6 +226,8 @@ class TestTask(Task):
             elif options['paths']:
                 raise TaskError(f'Test paths cannot be specified when using {switch}.')
         
+        self.verify_selection_arguments(options)
+        
         if options['no_cover']:
             if options['force_cover']:
                 raise TaskError('--cover and --no-cover are mutually exclusive.')
@@ -129,6 +236,36 @@ class TestTask(Task):
             elif options['reports_only']:
                 raise TaskError('--report and --no-cover are mutually exclusive.')
     
+    def verify_selection_arguments(self, options):
+        
+        # Verify the arguments that select which tests are run, and how they
+        # are split into shards
+        shard_switch = None
+        if options['shard'] or options['shards']:
+            shard_switch = '--shard' if options['shard'] else '--shards'
+        
+        failed_switch = None
+        if options['last_failed'] or options['failed_first']:
+            failed_switch = '--last-failed' if options['last_failed'] else '--failed-first'
+        
+        affected_switch = '--affected' if options['affected'] is not None else None
+        
+        if options['reports_only'] or options['erase_coverage']:
+            switch = '--report' if options['reports_only'] else '--erase'
+            for other_switch in (shard_switch, affected_switch, failed_switch):
+                if other_switch:
+                    raise TaskError(f'{other_switch} and {switch} are mutually exclusive.')
+        
+        # Shards are made up of whole test modules
+        if failed_switch and shard_switch:
+            raise TaskError(f'{failed_switch} and {shard_switch} are mutually exclusive.')
+        
+        if options['shards'] is not None:
+            if options['shards'] < 1:
+                raise TaskError('--shards must be at least 1.')
+            elif options['accumulate']:
+                raise TaskError('-a and --shards are mutually exclusive.')
+    
     def process_test_paths(self, test_paths):
         
         # Hook for subclasses to process test paths before they are used.
@@ -171,7 +308,7 @@ class TestTask(Task):
         # To facilitate reporting on previous test/coverage runs, store the
         # generated includes list in a file for later retrieval.
         
-        if not test_paths:
+        if not test_paths or any(os.path.normpath(path) == os.curdir for path in test_paths):
             includes = 'all'
         else:
             truncated_paths = set()
@@ -255,10 +392,11 @@ class TestTask(Task):
             
             if parallel:
                 if not HAS_TBLIB:
-                    self.stdout.write(self.styler.warning(
+                    self.stdout.write(
                         'Tracebacks in parallel tests may not display correctly: '
-                        'tblib not detected. pip install tblib to fix.'
-                    ))
+                        'tblib not detected. pip install tblib to fix.',
+                        style='warning'
+                    )
                 
                 command.append('--parallel')
                 if parallel is not True:
@@ -314,9 +452,168 @@ class TestTask(Task):
         else:
             self.stdout.write(f'Location of HTML report unknown, expected: {html_report_path}', style='warning')
     
+    @property
+    def durations_path(self):
+        
+        # Sharding is only deterministic if all shards use the same durations,
+        # so allow using a file that is shared, e.g. committed to the project
+        path = self.settings.get('durations_file', None)
+        if path:
+            return os.path.join(self.project_dir, path)
+        
+        return self.conf.get_state_path(DURATIONS_FILE_NAME)
+    
+    @property
+    def failures_path(self):
+        
+        return self.conf.get_state_path(FAILURES_FILE_NAME)
+    
+    def discover_test_modules(self, test_paths):
+        
+        try:
+            return discover_test_modules(test_paths)
+        except ValueError as e:
+            raise TaskError(str(e))
+    
+    def get_shards(self, test_paths, count):
+        """
+        Return a list of ``count`` lists, each containing the test modules to
+        run in one shard of the test suite (or of the given test paths).
+        """
+        
+        modules = self.discover_test_modules(test_paths)
+        
+        return split_modules(modules, count, load_durations(self.durations_path))
+    
+    def record_durations(self, paths):
+        
+        # Merge the durations of each test module, recorded by the test runner
+        # into each of the given files (if it supports doing so), into the
+        # stored durations
+        recorded = {}
+        for path in paths:
+            recorded.update(load_durations(path))
+        
+        if recorded:
+            durations = load_durations(self.durations_path)
+            durations.update(recorded)
+            save_durations(self.durations_path, durations)
+    
+    def record_failures(self, paths, rerun_paths=None):
+        """
+        Update the stored failed tests using the outcomes recorded by the test
+        runner into each of the given files (if it supports doing so). Tests
+        that passed are removed and tests that failed are added.
+        
+        If the run included previously failed tests, via ``--last-failed``
+        or ``--failed-first``, also pass the test paths that were run as
+        ``rerun_paths``. Any stored failures within them are then removed
+        even if they did not run at all, e.g. because they no longer exist.
+        """
+        
+        failed = set()
+        passed = set()
+        recorded = False
+        
+        for path in paths:
+            results = load_results(path)
+            if results is not None:
+                recorded = True
+                failed.update(results[0])
+                passed.update(results[1])
+        
+        if not recorded:
+            return
+        
+        failures = set(load_failures(self.failures_path))
+        failures.difference_update(passed)
+        
+        if rerun_paths is not None:
+            failures.difference_update(filter_failures(failures, rerun_paths))
+        
+        failures.update(failed)
+        save_failures(self.failures_path, failures)
+    
+    def do_sharded_tests(self, test_paths, coverage_command, **options):
+        
+        count = options['shards']
+        shards = self.get_shards(test_paths, count)
+        
+        # Each shard runs in a separate process, writing separate coverage
+        # data files to be combined afterwards
+        if coverage_command:
+            self.erase_coverage()
+            coverage_command = f'{coverage_command.rstrip()} --parallel-mode '
+        
+        # Run all shards at once, but display the output of each as a single
+        # block, in shard order
+        runs = []
+        with tempfile.TemporaryDirectory() as temp_dir, ThreadPoolExecutor(max_workers=count) as executor:
+            for index, modules in enumerate(shards, 1):
+                if not modules:
+                    continue
+                
+                buffer = OutputBuffer()
+                task = self.get_buffered_copy(buffer)
+                task.stdout.write(f'Running shard {index}/{count} ({len(modules)} test modules)', style='label')
+                
+                durations_path = os.path.join(temp_dir, f'shard{index}.json')
+                results_path = os.path.join(temp_dir, f'shard{index}_results.json')
+                env = {SHARD_ENV_VAR: index, DURATIONS_ENV_VAR: durations_path, RESULTS_ENV_VAR: results_path}
+                test_command = task.get_test_command(modules, using_coverage=bool(coverage_command), **options)
+                
+                future = executor.submit(task.cli, f'{coverage_command}{test_command}', env=env)
+                runs.append((index, modules, buffer, future, durations_path, results_path))
+            
+            results = {}
+            for index, modules, buffer, future, *_ in runs:
+                try:
+                    results[index] = future.result().returncode == 0
+                finally:
+                    buffer.flush()
+                
+                self.stdout.write('')  # newline
+            
+            self.record_durations([run[4] for run in runs])
+            self.record_failures([run[5] for run in runs])
+        
+        self._has_output = True
+        
+        self.stdout.write('Shards', style='label')
+        for index, modules in enumerate(shards, 1):
+            if not modules:
+                output = self.styler.warning('No tests')
+            elif results[index]:
+                output = self.styler.success('OK')
+            else:
+                output = self.styler.error('Failed')
+            
+            self.stdout.write(f'Shard {index}/{count}: {output}')
+        
+        if coverage_command:
+            self.stdout.write('')  # newline
+            self.cli('coverage combine')
+        
+        self.store_reporting_includes(test_paths)
+        
+        return all(results.values())
+    
     def do_tests(self, test_paths, coverage_command, **options):
         
-        test_command = self.get_test_command(test_paths, using_coverage=bool(coverage_command), **options)
+        if options['shards']:
+            return self.do_sharded_tests(test_paths, coverage_command, **options)
+        
+        run_paths = test_paths
+        if options['shard']:
+            index, count = options['shard']
+            run_paths = self.get_shards(test_paths, count)[index - 1]
+            
+            # Passing no test paths would run the entire suite
+            if not run_paths:
+                self.stdout.write(f'No tests in shard {index}/{count}', style='warning')
+                return None
+        
+        test_command = self.get_test_command(run_paths, using_coverage=bool(coverage_command), **options)
         
         # If coverage is enabled, ensure previous coverage data is erased prior
         # to the test suite being run, and combined afterwards. This ensures
@@ -330,7 +627,19 @@ class TestTask(Task):
         if handle_coverage:
             self.erase_coverage()
         
-        result = self.cli(f'{coverage_command}{test_command}')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            durations_path = os.path.join(temp_dir, DURATIONS_FILE_NAME)
+            results_path = os.path.join(temp_dir, FAILURES_FILE_NAME)
+            env = {DURATIONS_ENV_VAR: durations_path, RESULTS_ENV_VAR: results_path}
+            result = self.cli(f'{coverage_command}{test_command}', env=env)
+            
+            # Recording new durations would change how the suite is split,
+            # causing other shards to run inconsistent slices
+            if not options['shard']:
+                self.record_durations([durations_path])
+            
+            rerun = options['last_failed'] or options['failed_first']
+            self.record_failures([results_path], run_paths if rerun else None)
         
         if handle_coverage:
             self.stdout.write('')  # newline
@@ -344,10 +653,108 @@ class TestTask(Task):
         
         return result.returncode == 0
     
+    def get_import_graph(self):
+        
+        excludes = set(DEFAULT_AFFECTED_EXCLUDE)
+        excludes.update(self.settings.get('affected_exclude', ()))
+        
+        # Reuse the imports of unchanged modules from previous runs. Use a
+        # separate index to fable's, so neither has to load the other's.
+        index = FileIndex(
+            self.conf.get_state_path(IMPORT_INDEX_NAME),
+            consumer=IMPORT_GRAPH_CONSUMER,
+            signature={'root': os.getcwd()}
+        )
+        
+        return ImportGraph.build('./', excludes, index)
+    
+    def get_affected_tests(self, test_paths, ref):
+        """
+        Return the test modules affected by the files changed since the given
+        git reference (or the merge base with the ``branch_name`` branch, if
+        not given), limited to those within the given test paths, if any.
+        
+        A test module is affected if it imports a changed module, directly or
+        indirectly, or if a changed file is within the same app. If a changed
+        file may affect any test, e.g. a settings module or migration, return
+        ``None`` to run all tests.
+        """
+        
+        branch_name = self.settings.get('branch_name', DEFAULT_BRANCH_NAME)
+        
+        # Include deleted files, as modules importing them are affected
+        try:
+            changed_files = find_changed_files('./', ref, branch_name, deleted=True)
+        except ValueError as e:
+            raise TaskError(str(e))
+        
+        full_suite = get_matcher(self.settings.get('affected_full_suite', DEFAULT_AFFECTED_FULL_SUITE))
+        for path in changed_files:
+            if full_suite.match(path):
+                self.stdout.write(f'{path} has changed, running all tests')
+                return None
+        
+        changed = {get_module_name(path) for path in changed_files}
+        affected = self.get_import_graph().get_dependents(changed)
+        
+        tests = []
+        for module in self.discover_test_modules(test_paths):
+            # The app of a test module is the package containing its "test"
+            # module or package, e.g. "myapp" for "myapp.tests.test_models"
+            parts = module.split('.')
+            app = '.'.join(parts[:next((i for i, p in enumerate(parts) if p.startswith('test')), -1)])
+            
+            if module in affected or (app and any(c.startswith(f'{app}.') for c in changed)):
+                tests.append(module)
+        
+        self.stdout.write(f'{len(changed_files)} changed files affect {len(tests)} test modules')
+        
+        return tests
+    
+    def get_failed_tests(self, test_paths, last_failed):
+        """
+        Return the test paths to run in order to rerun the tests that failed
+        the last time they were run, limited to those within the given test
+        paths, if any. If ``last_failed`` is ``True``, return only the failed
+        tests. Otherwise, return the failed tests followed by the given test
+        paths, so the failed tests run first.
+        """
+        
+        failures = filter_failures(load_failures(self.failures_path), test_paths)
+        
+        if not failures:
+            if last_failed:
+                self.stdout.write('No failed tests recorded, running all tests')
+            
+            return test_paths
+        
+        if last_failed:
+            self.stdout.write(f'Rerunning {len(failures)} failed tests')
+            return failures
+        
+        self.stdout.write(f'Running {len(failures)} failed tests first')
+        
+        # Django removes the duplicate tests found via the given test paths,
+        # keeping the first occurrence. Passing no test paths would only run
+        # the failed tests, so pass the current directory instead.
+        return failures + (test_paths or [os.curdir])
+    
     def handle_tests(self, paths, **options):
         
         test_paths = self.process_test_paths(paths)
         
+        if options['affected'] is not None:
+            affected = self.get_affected_tests(test_paths, options['affected'])
+            if affected is not None:
+                # Passing no test paths would run the entire suite
+                if not affected:
+                    return None
+                
+                test_paths = affected
+        
+        if options['last_failed'] or options['failed_first']:
+            test_paths = self.get_failed_tests(test_paths, options['last_failed'])
+        
         if not HAS_COVERAGE:
             coverage_command = ''
         elif options['no_cover'] or options['quick']:
@@ -379,6 +786,9 @@ class TestTask(Task):
             test_paths = options.pop('paths', None)
             tests_passed = self.handle_tests(test_paths, **options)
             self.stdout.write('')  # newline
+            
+            if tests_passed is None:
+                return  # no tests were run, so there is nothing to report
         
         if not HAS_COVERAGE:
             # Not having coverage available is simply a warning unless directly
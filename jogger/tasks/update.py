@@ -1,6 +1,7 @@
 import os
 import shutil
 import sys
+from contextlib import contextmanager
 
 from .base import Task, TaskDefinitionError, TaskError
 
@@ -38,11 +39,54 @@ class UpdateTask(Task):
             )
         )
     
+    @contextmanager
+    def step(self, name):
+        
+        # Flag steps that waited for user input, so their durations (which
+        # include the time taken to answer) are not recorded
+        self._prompted = False
+        with super().step(name) as step:
+            try:
+                yield step
+            finally:
+                if self._prompted:
+                    step['interactive'] = True
+    
+    def prompt(self, message):
+        
+        self._prompted = True
+        
+        return input(message)
+    
     @property
     def branch_name(self):
         
         return self.settings.get('branch_name', self.default_branch_name)
     
+    def get_plan(self, **options):
+        
+        plan = []
+        
+        if not options['skip_pull']:
+            plan.append('pull')
+        
+        plan.extend(('dependencies', 'migrations'))
+        
+        # Stale content types are not checked in no-input mode
+        if not options['no_input']:
+            plan.append('content_types')
+        
+        try:
+            self.get_task_proxy('build')
+        except TaskDefinitionError:
+            pass
+        else:
+            plan.append('build')
+        
+        plan.append('collect_static')
+        
+        return plan
+    
     def handle(self, **options):
         
         if not options['skip_pull']:
@@ -52,26 +96,36 @@ class UpdateTask(Task):
         requirements_path, temp_requirements_path = self.check_initial_requirements()
         
         if not options['skip_pull']:
-            self.do_pull()
-            
-            # Assume success. Errors/issues will interrupt the process.
-            summary['pull'] = True
+            with self.step('pull') as step:
+                self.do_pull()
+                
+                # Assume success. Errors/issues will interrupt the process.
+                summary['pull'] = step['outcome'] = True
         else:
             summary['pull'] = None  # skipped
         
         self.pre_update()
         
-        summary['dependencies'] = self.do_dependency_check(requirements_path, temp_requirements_path)
-        summary['migrations'] = self.do_migration_check()
-        summary['content_types'] = self.do_stale_contenttypes_check()
+        with self.step('dependencies') as step:
+            result = self.do_dependency_check(requirements_path, temp_requirements_path)
+            summary['dependencies'] = step['outcome'] = result
+        
+        with self.step('migrations') as step:
+            summary['migrations'] = step['outcome'] = self.do_migration_check()
+        
+        with self.step('content_types') as step:
+            summary['content_types'] = step['outcome'] = self.do_stale_contenttypes_check()
         
         # A build step may not be defined, so a result of None indicates no
         # build at all, rather than the step being skipped
-        build_result = self.do_build()
+        with self.step('build') as step:
+            build_result = step['outcome'] = self.do_build()
+        
         if build_result is not None:
             summary['build'] = build_result
         
-        summary['collect_static'] = self.do_collect_static()
+        with self.step('collect_static') as step:
+            summary['collect_static'] = step['outcome'] = self.do_collect_static()
         
         self.post_update()
         self.show_summary(summary)
@@ -161,7 +215,7 @@ class UpdateTask(Task):
         else:
             self.stdout.write(diff_result.stdout.decode('utf-8'))
             
-            answer = input(
+            answer = self.prompt(
                 'The above Python library dependency changes were detected, '
                 'update now [y/n]? '
             )
@@ -209,7 +263,7 @@ class UpdateTask(Task):
             answer = 'y'
         else:
             self.stdout.write(plan_result.stdout.decode('utf-8'))
-            answer = input('The above migrations are unapplied, apply them now [y/n]? ')
+            answer = self.prompt('The above migrations are unapplied, apply them now [y/n]? ')
         
         if answer.lower() == 'y':
             migrate_result = self.cli('python manage.py migrate')
@@ -254,7 +308,7 @@ class UpdateTask(Task):
         output = result.stdout.decode('utf-8').strip().splitlines()[:-1]
         self.stdout.write('\n'.join(output))
         
-        answer = input("Type 'yes' to continue, or 'no' to cancel: ")
+        answer = self.prompt("Type 'yes' to continue, or 'no' to cancel: ")
         
         if answer.lower() != 'yes':
             return None  # skipped
@@ -299,7 +353,7 @@ class UpdateTask(Task):
                 f'This may {self.styler.label("overwrite existing files")} in your'
                 ' static files directory. Are you sure you want to do this?'
             )
-            answer = input('Collect static files now [y/n]? ')
+            answer = self.prompt('Collect static files now [y/n]? ')
         
         if answer.lower() != 'y':
             return None  # skipped
@@ -13,6 +13,7 @@ from .files import find_file
 
 MAX_CONFIG_FILE_SEARCH_DEPTH = 8
 JOG_FILE_NAME = 'jog.py'
+STATE_DIR_NAME = '.jogger'
 CONFIG_TABLE = 'jogger'
 
 
@@ -78,6 +79,10 @@ class JogConf:
         self.project_dir = project_dir
         self.jog_file_path = jog_file_path
         
+        # The directory in which jogger stores any state it maintains between
+        # runs, such as the history of task runs
+        self.state_dir = os.path.join(project_dir, STATE_DIR_NAME)
+        
         # Define paths to accepted config files, and the prefixes for the table
         # within each file, to which the name of the task will be added, that
         # contains the task settings.
@@ -96,6 +101,19 @@ class JogConf:
             (os.path.join(project_dir, 'joggerenv.cfg'), f'{CONFIG_TABLE}:')
         ]
     
+    def get_state_path(self, file_name):
+        """
+        Return the absolute path to the file of the given name within the
+        project's state directory, creating the directory if necessary.
+        
+        :param file_name: The name of the file.
+        :return: The absolute path to the file.
+        """
+        
+        os.makedirs(self.state_dir, exist_ok=True)
+        
+        return os.path.join(self.state_dir, file_name)
+    
     def get_tasks(self):
         """
         Import the located task definition file as a Python module and return
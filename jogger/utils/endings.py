@@ -0,0 +1,276 @@
+import re
+
+from .files import atomic_write
+
+ENDINGS = {
+    'CRLF': b'\r\n',
+    'CR': b'\r',
+    'LF': b'\n'
+}
+
+CHUNK_SIZE = 1024 * 1024  # 1MB in bytes
+
+# Patterns matching each line ending, excluding the parts of CRLF endings
+ENDING_PATTERNS = {
+    'CRLF': re.compile(rb'\r\n'),
+    'CR': re.compile(rb'\r(?!\n)'),
+    'LF': re.compile(rb'(?<!\r)\n')
+}
+
+DEFAULT_DETAIL_LINES = 10
+
+# The number of bytes at the start of a file used to detect binary content,
+# and the proportion of them that must be "non-text" to consider it binary
+BINARY_SNIFF_SIZE = 8192
+BINARY_THRESHOLD = 0.3
+
+# Bytes considered to be text: printable ASCII, common control characters
+# (BEL, BS, TAB, LF, FF, CR, ESC), and all non-ASCII bytes (e.g. UTF-8)
+TEXT_BYTES = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(32, 127)) | set(range(128, 256)))
+
+
+def is_binary(block):
+    """
+    Return ``True`` if the given block of bytes, typically read from the
+    start of a file, appears to be binary rather than text: if it contains
+    any NUL bytes, or if more than ``BINARY_THRESHOLD`` of its bytes are
+    not text characters. Return ``False`` otherwise.
+    """
+    
+    if not block:
+        return False
+    
+    if b'\0' in block:
+        return True
+    
+    non_text = block.translate(None, TEXT_BYTES)
+    
+    return len(non_text) / len(block) > BINARY_THRESHOLD
+
+
+def count_endings(f, stop=None, chunk_size=CHUNK_SIZE):
+    """
+    Count the line endings of each type in the given binary file object,
+    reading it in fixed-size chunks so memory use is constant regardless of
+    the size of the file. ``CRLF`` endings split across two chunks are
+    counted correctly.
+    
+    :param f: A file object opened in binary mode.
+    :param stop: An optional iterable of ending names (e.g. ``('CR', )``).
+        If given, stop reading as soon as an ending of any of these types is
+        found, in which case the counts are incomplete.
+    :param chunk_size: The number of bytes to read at a time.
+    :return: A dictionary mapping the name of each ending (as per
+        ``ENDINGS``) to the number of times it was found.
+    """
+    
+    counts = dict.fromkeys(ENDINGS, 0)
+    pending_cr = False
+    
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        
+        start = 0
+        end = len(chunk)
+        
+        # A CR at the end of the previous chunk is only a CRLF if this chunk
+        # starts with an LF
+        if pending_cr:
+            if chunk[:1] == b'\n':
+                counts['CRLF'] += 1
+                start = 1
+            else:
+                counts['CR'] += 1
+        
+        # Likewise, defer counting a CR at the end of this chunk until the
+        # next one has been read
+        pending_cr = chunk[-1:] == b'\r'
+        if pending_cr:
+            end -= 1
+        
+        crlf = chunk.count(b'\r\n', start, end)
+        counts['CRLF'] += crlf
+        counts['CR'] += chunk.count(b'\r', start, end) - crlf
+        counts['LF'] += chunk.count(b'\n', start, end) - crlf
+        
+        if stop and any(counts[name] for name in stop):
+            return counts
+    
+    if pending_cr:
+        counts['CR'] += 1
+    
+    return counts
+
+
+def find_bad_ending(f, good_ending, chunk_size=CHUNK_SIZE):
+    """
+    Return the name of the first type of line ending (in the order of
+    ``ENDINGS``) found in the given binary file object, other than
+    ``good_ending``. Return ``None`` if only good endings are found.
+    
+    :param f: A file object opened in binary mode.
+    :param good_ending: The name of the acceptable line ending, e.g. ``'LF'``.
+    :param chunk_size: The number of bytes to read at a time.
+    :return: The name of the bad line ending found, or ``None``.
+    """
+    
+    bad_endings = [name for name in ENDINGS if name != good_ending]
+    counts = count_endings(f, stop=bad_endings, chunk_size=chunk_size)
+    
+    for name in bad_endings:
+        if counts[name]:
+            return name
+    
+    return None
+
+
+def count_line_breaks(chunk, start, end):
+    
+    # Each CRLF is counted once by each of the CR and LF counts
+    crlf = chunk.count(b'\r\n', start, end)
+    
+    return chunk.count(b'\r', start, end) + chunk.count(b'\n', start, end) - crlf
+
+
+def analyse_endings(f, good_ending, max_lines=DEFAULT_DETAIL_LINES, chunk_size=CHUNK_SIZE):
+    """
+    Count the line endings of each type in the given binary file object,
+    and find the line numbers of the first ``max_lines`` endings of each
+    type other than ``good_ending``. The file is read in fixed-size chunks,
+    in a single pass.
+    
+    Rather than iterating over each line, the offsets of the bad endings in
+    each chunk are found using regular expressions, and converted to line
+    numbers by counting the line breaks between them.
+    
+    :param f: A file object opened in binary mode.
+    :param good_ending: The name of the acceptable line ending, e.g. ``'LF'``.
+    :param max_lines: The maximum number of line numbers to find for each
+        type of bad ending.
+    :param chunk_size: The number of bytes to read at a time.
+    :return: A ``(counts, lines)`` tuple. ``counts`` is a dictionary mapping
+        the name of each ending to the number of times it was found.
+        ``lines`` is a dictionary mapping the name of each bad ending to a
+        list of the (1-based) line numbers it was found on.
+    """
+    
+    counts = dict.fromkeys(ENDINGS, 0)
+    lines = {name: [] for name in ENDINGS if name != good_ending}
+    line_base = 0  # the number of line breaks before the current chunk
+    carry = b''
+    
+    eof = False
+    while not eof:
+        data = f.read(chunk_size)
+        eof = not data
+        
+        # Hold back a CR at the end of the chunk until the next one has been
+        # read, in case it is the first half of a CRLF
+        chunk = carry + data
+        carry = b''
+        if not eof and chunk[-1:] == b'\r':
+            carry = b'\r'
+            chunk = chunk[:-1]
+        
+        crlf = chunk.count(b'\r\n')
+        counts['CRLF'] += crlf
+        counts['CR'] += chunk.count(b'\r') - crlf
+        counts['LF'] += chunk.count(b'\n') - crlf
+        
+        # Find the offsets of bad endings still needing line numbers
+        offsets = []
+        for name, found in lines.items():
+            needed = max_lines - len(found)
+            if needed <= 0:
+                continue
+            
+            for match in ENDING_PATTERNS[name].finditer(chunk):
+                offsets.append((match.start(), name))
+                needed -= 1
+                if not needed:
+                    break
+        
+        position = 0
+        line = line_base
+        for offset, name in sorted(offsets):
+            line += count_line_breaks(chunk, position, offset)
+            lines[name].append(line + 1)
+            position = offset
+        
+        line_base += count_line_breaks(chunk, 0, len(chunk))
+    
+    return counts, lines
+
+
+def convert_endings(src, dst, good_ending, chunk_size=CHUNK_SIZE):
+    """
+    Copy the content of the ``src`` binary file object to the ``dst``
+    binary file object, converting all line endings to ``good_ending``.
+    The content is converted in fixed-size chunks, so memory use is constant
+    regardless of the size of the file.
+    
+    :param src: A file object opened for reading in binary mode.
+    :param dst: A file object opened for writing in binary mode.
+    :param good_ending: The name of the line ending to convert to, e.g.
+        ``'LF'``.
+    :param chunk_size: The number of bytes to read at a time.
+    :return: A dictionary mapping the name of each other type of line
+        ending to the number of them that were converted.
+    """
+    
+    good = ENDINGS[good_ending]
+    counts = dict.fromkeys(ENDINGS, 0)
+    carry = b''
+    
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        
+        # Hold back a CR at the end of the chunk until the next one has been
+        # read, in case it is the first half of a CRLF
+        chunk = carry + chunk
+        if chunk[-1:] == b'\r':
+            carry = b'\r'
+            chunk = chunk[:-1]
+        else:
+            carry = b''
+        
+        crlf = chunk.count(b'\r\n')
+        counts['CRLF'] += crlf
+        counts['CR'] += chunk.count(b'\r') - crlf
+        counts['LF'] += chunk.count(b'\n') - crlf
+        
+        # Normalise all endings to LF, then to the good ending if different
+        chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        if good != b'\n':
+            chunk = chunk.replace(b'\n', good)
+        
+        dst.write(chunk)
+    
+    if carry:
+        counts['CR'] += 1
+        dst.write(good)
+    
+    return {name: count for name, count in counts.items() if name != good_ending}
+
+
+def fix_endings(path, good_ending, chunk_size=CHUNK_SIZE):
+    """
+    Convert all line endings in the file at the given path to
+    ``good_ending``. The converted content is written to a temporary file
+    in the same directory, which then atomically replaces the original.
+    The original file's permissions are preserved.
+    
+    :param path: The path of the file to convert.
+    :param good_ending: The name of the line ending to convert to, e.g.
+        ``'LF'``.
+    :param chunk_size: The number of bytes to read at a time.
+    :return: A dictionary mapping the name of each other type of line
+        ending to the number of them that were converted.
+    """
+    
+    with atomic_write(path, 'wb', copy_mode=True) as dst, open(path, 'rb') as src:
+        return convert_endings(src, dst, good_ending, chunk_size)
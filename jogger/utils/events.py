@@ -0,0 +1,110 @@
+import threading
+import time
+from contextlib import contextmanager
+
+#
+# A minimal, process-wide event system used to report on the progress of
+# tasks as they execute: the start and end of each task, command, etc. Events
+# are dictionaries, passed to each registered listener (any callable) in the
+# thread that emitted them. Listeners are responsible for their own thread
+# safety, if necessary.
+#
+
+_listeners = []
+
+
+def add_listener(listener):
+    """
+    Register ``listener`` to be called with each subsequently emitted event.
+    """
+    
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """
+    Stop calling ``listener`` with emitted events.
+    """
+    
+    try:
+        _listeners.remove(listener)
+    except ValueError:
+        pass
+
+
+def get_exit_status(exception):
+    """
+    Return the exit status implied by the given exception having been raised:
+    the exit code for a ``SystemExit``, and ``1`` for anything else.
+    """
+    
+    if isinstance(exception, SystemExit):
+        code = exception.code
+        if code is None:
+            return 0
+        elif isinstance(code, int):
+            return code
+    
+    return 1
+
+
+def emit(event, **data):
+    """
+    Pass an event of the given type, with the given data, to all registered
+    listeners. All events include the time they were emitted, and the name
+    and identifier of the thread that emitted them.
+    
+    :param event: The event type, e.g. ``'task_start'``.
+    :param data: Any additional data describing the event.
+    """
+    
+    if not _listeners:
+        return
+    
+    thread = threading.current_thread()
+    event = {
+        'event': event,
+        'time': time.time(),
+        'thread': thread.ident,
+        'thread_name': thread.name,
+        **data
+    }
+    
+    for listener in tuple(_listeners):
+        listener(event)
+
+
+@contextmanager
+def span(name, **data):
+    """
+    A context manager that emits ``<name>_start`` and ``<name>_end`` events
+    when entering and exiting the context, respectively. Both events include
+    the given ``data``. The end event also includes the ``duration`` of the
+    span, in seconds, and the exit ``status`` of the code within it (``0``
+    unless an exception was raised). If the code within it called
+    ``sys.exit()``, the end event also includes ``exited``.
+    
+    The context manager yields a dictionary that can be used to add further
+    data to the end event, e.g. the outcome of the operation::
+    
+        with span('command', command=cmd) as end_data:
+            result = subprocess.run(cmd)
+            end_data['returncode'] = result.returncode
+    """
+    
+    emit(f'{name}_start', **data)
+    
+    end_data = {'status': 0}
+    start = time.perf_counter()
+    
+    try:
+        yield end_data
+    except BaseException as e:
+        end_data['status'] = get_exit_status(e)
+        if isinstance(e, SystemExit):
+            end_data['exited'] = True
+        
+        raise
+    finally:
+        end_data['duration'] = time.perf_counter() - start
+        emit(f'{name}_end', **{**data, **end_data})
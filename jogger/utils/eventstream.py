@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+
+from . import events
+
+
+class EventStream:
+    """
+    A context manager that writes each event emitted while it is active to
+    the given destination as a single line of JSON (the "JSON lines" format).
+    Events are written, and flushed, as they occur, allowing the stream to be
+    consumed live, e.g. by a CI dashboard.
+    
+    :param destination: The path of the file to write to, or the number of
+        an open file descriptor (as a string), e.g. ``'3'``.
+    """
+    
+    def __init__(self, destination):
+        
+        self.destination = destination
+        self.stream = None
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        
+        if self.destination.isdigit():
+            # Leave the file descriptor open, it belongs to the caller
+            self.stream = os.fdopen(int(self.destination), 'w', closefd=False)
+        else:
+            self.stream = open(self.destination, 'w')
+        
+        events.add_listener(self)
+        
+        return self
+    
+    def __exit__(self, *args):
+        
+        events.remove_listener(self)
+        self.stream.close()
+    
+    def __call__(self, event):
+        
+        line = json.dumps(event, default=str)
+        
+        with self._lock:
+            self.stream.write(f'{line}\n')
+            self.stream.flush()
+    
+    def report(self, stdout):
+        
+        # Nothing to report, events are written as they occur
+        pass
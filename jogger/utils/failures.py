@@ -0,0 +1,76 @@
+import os
+
+from .files import atomic_write_json, read_json
+from .imports import get_module_name
+
+FAILURES_FILE_NAME = 'test_failures.json'
+
+# Environment variable used to communicate with the test runner in the test
+# process. See jogger.utils.runner.
+RESULTS_ENV_VAR = 'JOGGER_TEST_RESULTS'
+
+
+def load_results(path):
+    """
+    Return the IDs of the tests that failed and passed in a run of the test
+    suite, as recorded by the test runner in the JSON file at the given path.
+    Return ``None`` if the file does not exist or cannot be read, e.g. if the
+    test runner does not support recording results.
+    
+    :param path: The path of the JSON file.
+    :return: A ``(failed, passed)`` tuple of sets of test IDs, or ``None``.
+    """
+    
+    results = read_json(path, dict)
+    if results is None:
+        return None
+    
+    return set(results.get('failed', ())), set(results.get('passed', ()))
+
+
+def load_failures(path):
+    """
+    Return the sorted list of failed test IDs stored in the JSON file at the
+    given path. Return an empty list if the file does not exist or cannot
+    be read.
+    """
+    
+    return sorted(read_json(path, list) or ())
+
+
+def save_failures(path, failures):
+    """
+    Write the given iterable of failed test IDs to the JSON file at the given
+    path. The file is replaced atomically, so concurrent readers never see it
+    partially written.
+    """
+    
+    atomic_write_json(path, sorted(failures), indent=0)
+
+
+def filter_failures(failures, labels):
+    """
+    Return the failed test IDs that are within any of the given test labels,
+    as accepted by ``manage.py test``. Labels can be dotted paths or file
+    paths. If no labels are given, return all failures.
+    
+    :param failures: An iterable of test IDs, e.g.
+        ``myapp.tests.test_models.ModelTestCase.test_save``.
+    :param labels: An optional list of test labels.
+    :return: A sorted list of test IDs.
+    """
+    
+    if not labels:
+        return sorted(failures)
+    
+    prefixes = []
+    for label in labels:
+        if os.path.exists(label):
+            label = get_module_name(label)
+        
+        prefixes.append(label)
+    
+    return sorted(
+        failure for failure in failures
+        if any(not prefix or failure == prefix or failure.startswith(f'{prefix}.') for prefix in prefixes)
+    )
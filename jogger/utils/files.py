@@ -1,5 +1,23 @@
+import json
 import os
+import queue
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from fnmatch import fnmatch as std_fnmatch
+from fnmatch import translate
+from functools import lru_cache
+
+MAGIC_CHARS_RE = re.compile(r'[*?[]')
+
+# Patterns and paths only need normalising on case-insensitive platforms
+# (i.e. Windows), where os.path.normcase() is not a no-op
+NORMCASE = os.path.normcase('Aa/') != 'Aa/'
+
+FILE_INDEX_NAME = 'file_index.json'
+FILE_INDEX_VERSION = 1
 
 
 def find_file(target_file_name, from_path, max_search_depth=16):
@@ -54,6 +72,115 @@ def fnmatch(filename, patterns):
     return any(std_fnmatch(filename, pattern) for pattern in patterns)
 
 
+class PathMatcher:
+    """
+    A compiled set of ``fnmatch``-style patterns, for efficiently testing
+    many paths against them. Paths match under the same rules as
+    :func:`pathmatch`.
+    
+    Patterns are sorted into the cheapest form that can test them: literal
+    strings are tested via a set lookup, patterns with a single leading or
+    trailing ``*`` (e.g. ``*.pyc``) via ``str.startswith()``/``str.endswith()``,
+    and all others via a single combined regular expression.
+    
+    :param patterns: An iterable of patterns to test against.
+    """
+    
+    def __init__(self, patterns):
+        
+        self.patterns = tuple(patterns)
+        
+        literals = set()
+        prefixes = []
+        suffixes = []
+        others = []
+        
+        for pattern in self.patterns:
+            if NORMCASE:
+                pattern = os.path.normcase(pattern)
+            
+            if not MAGIC_CHARS_RE.search(pattern):
+                literals.add(pattern)
+            elif pattern.endswith('*') and not MAGIC_CHARS_RE.search(pattern[:-1]):
+                prefixes.append(pattern[:-1])
+            elif pattern.startswith('*') and not MAGIC_CHARS_RE.search(pattern[1:]):
+                suffixes.append(pattern[1:])
+            else:
+                others.append(translate(pattern))
+        
+        self.literals = literals
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(suffixes)
+        self.regex = re.compile('|'.join(others)) if others else None
+    
+    def __bool__(self):
+        
+        return bool(self.patterns)
+    
+    def _match(self, value):
+        
+        if NORMCASE:
+            value = os.path.normcase(value)
+        
+        return (
+            value in self.literals
+            or (self.prefixes and value.startswith(self.prefixes))
+            or (self.suffixes and value.endswith(self.suffixes))
+            or (self.regex is not None and self.regex.match(value) is not None)
+        )
+    
+    def match(self, path, basename=None, absolute_path=None):
+        """
+        Test whether the ``path`` string matches any of the patterns. ``path``
+        can be a relative file path, with both its basename and absolute path
+        also tested against the patterns.
+        
+        Callers that already know the basename and/or absolute path of
+        ``path`` can provide them, to avoid them being calculated again.
+        
+        :param path: The file path to test.
+        :param basename: The basename of ``path``, if known.
+        :param absolute_path: The absolute path of ``path``, if known.
+        :return: ``True`` if a match is found, ``False`` if not.
+        """
+        
+        if self._match(path):
+            return True
+        
+        if basename is None:
+            basename = os.path.basename(path)
+        
+        if self._match(basename):
+            return True
+        
+        if absolute_path is None:
+            absolute_path = os.path.abspath(path)
+        
+        return bool(self._match(absolute_path))
+
+
+@lru_cache(maxsize=32)
+def _get_matcher(patterns):
+    
+    return PathMatcher(patterns)
+
+
+def get_matcher(patterns):
+    """
+    Return a :class:`PathMatcher` for the given patterns. ``patterns`` may
+    be an iterable of pattern strings or an existing ``PathMatcher``, which
+    is returned as-is. Matchers for recently used patterns are cached.
+    
+    :param patterns: An iterable of patterns, or a ``PathMatcher``.
+    :return: The ``PathMatcher`` instance.
+    """
+    
+    if isinstance(patterns, PathMatcher):
+        return patterns
+    
+    return _get_matcher(frozenset(patterns))
+
+
 def pathmatch(path, patterns):
     """
     Test whether the ``path`` string matches any of the strings in ``patterns``.
@@ -61,19 +188,167 @@ def pathmatch(path, patterns):
     path also tested against ``patterns``.
     
     :param path: The file path to test.
-    :param patterns: An iterable of patterns to test against.
+    :param patterns: An iterable of patterns to test against, or a compiled
+        :class:`PathMatcher`.
     :return: ``True`` if a match is found, ``False`` if not.
     """
     
-    if fnmatch(path, patterns):
-        return True
+    return get_matcher(patterns).match(path)
+
+
+def _scan_dir(path, absolute_path, matcher):
+    """
+    Return the files and subdirectories of the ``path`` directory that are
+    not excluded by ``matcher``, as two lists of ``os.DirEntry`` objects
+    (files first). Like ``os.walk()``, symlinks to directories are included
+    as subdirectories, but not descended into, and unreadable directories
+    are ignored.
+    """
+    
+    files = []
+    dirs = []
+    
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return files, dirs
+    
+    for entry in entries:
+        if matcher and matcher.match(entry.path, entry.name, os.path.join(absolute_path, entry.name)):
+            continue
+        
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        
+        if is_dir:
+            dirs.append(entry)
+        else:
+            files.append(entry)
+    
+    return files, dirs
+
+
+def _consume_ordered(root):
+    
+    # Consume the results of a parallel scan in the same order as a
+    # sequential scan, using a stack of pending directories
+    stack = [root]
+    while stack:
+        files, children = stack.pop().result()
+        yield from files
+        stack.extend(reversed(children))
+
+
+def _consume_unordered(results):
+    
+    # Consume the results of a parallel scan as soon as each directory is
+    # read, tracking the number of directories still to come
+    pending = 1
+    while pending:
+        result = results.get()
+        if isinstance(result, BaseException):
+            raise result
+        
+        files, child_count = result
+        pending += child_count - 1
+        yield from files
+
+
+def _parallel_scan(from_path, matcher, workers, ordered):
+    
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+    results = queue.Queue()
+    
+    def visit(path):
+        
+        try:
+            absolute_path = os.path.abspath(path) if matcher else None
+            files, dirs = _scan_dir(path, absolute_path, matcher)
+            subdirs = [entry.path for entry in dirs if not entry.is_symlink()]
+        except BaseException as e:
+            if not ordered:
+                results.put(e)
+            
+            raise
+        
+        # Report the results before queuing any subdirectories, so the
+        # consumer always knows of them before their own results arrive
+        if not ordered:
+            results.put((files, len(subdirs)))
+        
+        # Queue subdirectories immediately, rather than waiting for the
+        # consumer to reach them, so all workers are kept busy
+        children = []
+        try:
+            for subdir in subdirs:
+                children.append(executor.submit(visit, subdir))
+        except RuntimeError:
+            # The executor has been shut down, the consumer has stopped
+            # iterating and the results are no longer required
+            pass
+        
+        return files, children
+    
+    try:
+        root = executor.submit(visit, from_path)
+        
+        if ordered:
+            yield from _consume_ordered(root)
+        else:
+            yield from _consume_unordered(results)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def scan(from_path, exclude_patterns=None, workers=1, ordered=True):
+    """
+    Yield an ``os.DirEntry`` object for all files under the ``from_path``
+    directory, optionally excluding any files/directories matching any of
+    the pattern strings in ``exclude_patterns``.
+    
+    Files are yielded in the same order, and with the same paths (available
+    via ``entry.path``), as :func:`walk`. But as ``DirEntry`` objects cache
+    the file type and (once retrieved via ``entry.stat()``) other metadata,
+    they avoid the need for additional system calls to get file sizes etc.
+    
+    On high-latency filesystems (e.g. NFS), most of the time spent scanning
+    a large tree is spent waiting on directory reads. Using multiple
+    ``workers`` reads directories concurrently, in a pool of threads. By
+    default, files are still yielded in the same order as a sequential scan.
+    Passing ``ordered=False`` yields them as soon as each directory is read,
+    in no particular order.
+    
+    :param from_path: The root directory to scan.
+    :param exclude_patterns: An iterable of patterns to test against, or a
+        compiled :class:`PathMatcher`.
+    :param workers: The number of threads to read directories with.
+    :param ordered: ``False`` to yield files in the order their directories
+        are read, when using multiple workers.
+    """
+    
+    matcher = get_matcher(exclude_patterns) if exclude_patterns else None
     
-    basename = os.path.basename(path)
-    if fnmatch(basename, patterns):
-        return True
+    if workers > 1:
+        yield from _parallel_scan(from_path, matcher, workers, ordered)
+        return
     
-    absolute_path = os.path.abspath(path)
-    return fnmatch(absolute_path, patterns)
+    # Use an explicit stack of directories rather than recursion, to yield
+    # each directory's files before descending into its subdirectories
+    stack = [from_path]
+    while stack:
+        path = stack.pop()
+        
+        # Only calculate the absolute path once per directory, rather than
+        # for every file and subdirectory within it
+        absolute_path = os.path.abspath(path) if matcher else None
+        files, dirs = _scan_dir(path, absolute_path, matcher)
+        
+        yield from files
+        
+        stack.extend(entry.path for entry in reversed(dirs) if not entry.is_symlink())
 
 
 def walk(from_path, exclude_patterns=None):
@@ -83,27 +358,240 @@ def walk(from_path, exclude_patterns=None):
     ``exclude_patterns``.
     
     :param from_path: The root directory to walk.
-    :param exclude_patterns: An iterable of patterns to test against.
+    :param exclude_patterns: An iterable of patterns to test against, or a
+        compiled :class:`PathMatcher`.
+    """
+    
+    for entry in scan(from_path, exclude_patterns):
+        yield entry.path
+
+
+def filter_paths(paths, exclude_patterns):
+    """
+    Yield the paths from the given iterable of file paths that do not match
+    any of the pattern strings in ``exclude_patterns``. As with :func:`walk`,
+    files within an excluded directory are also excluded.
+    
+    :param paths: An iterable of file paths, e.g. ``./src/app.py``.
+    :param exclude_patterns: An iterable of patterns to test against, or a
+        compiled :class:`PathMatcher`.
     """
     
     if not exclude_patterns:
-        # No exclusion patterns, perform simple directory walk
-        for root, dirs, files in os.walk(from_path):
-            for filename in files:
-                yield os.path.join(root, filename)
-    else:
-        # Perform more complex directory walk, excluding files/directories
-        # matching given exclusion patterns
-        for root, dirs, files in os.walk(from_path, topdown=True):
-            # Removing items from `dirs` will prevent `os.walk` from entering
-            # those subdirectories. Iterate a copy so removals don't result in
-            # an early exit from the loop.
-            for directory in dirs.copy():
-                joined = os.path.join(root, directory)
-                if pathmatch(joined, exclude_patterns):
-                    dirs.remove(directory)
-            
-            for filename in files:
-                joined = os.path.join(root, filename)
-                if not pathmatch(joined, exclude_patterns):
-                    yield joined
+        yield from paths
+        return
+    
+    matcher = get_matcher(exclude_patterns)
+    
+    # Cache whether each directory is excluded (including via one of its
+    # parents), and its absolute path, as most will contain multiple files
+    dirs = {}
+    
+    def get_dir(path):
+        
+        try:
+            return dirs[path]
+        except KeyError:
+            pass
+        
+        absolute_path = os.path.abspath(path)
+        parent, name = os.path.split(path)
+        if not name or name == os.curdir:
+            excluded = False
+        else:
+            excluded = get_dir(parent)[0] or matcher.match(path, name, absolute_path)
+        
+        dirs[path] = excluded, absolute_path
+        
+        return dirs[path]
+    
+    for path in paths:
+        directory, name = os.path.split(path)
+        excluded, absolute_dir = get_dir(directory)
+        if not excluded and not matcher.match(path, name, os.path.join(absolute_dir, name)):
+            yield path
+
+
+@contextmanager
+def atomic_write(path, mode='w', copy_mode=False):
+    """
+    Return a context manager providing a file object that writes to a
+    temporary file in the same directory as ``path``. When the context
+    manager exits successfully, the temporary file atomically replaces the
+    file at ``path``, so it is never left partially written, even if
+    multiple processes write to it. If an exception is raised, the
+    temporary file is removed and ``path`` is left untouched.
+    
+    :param path: The path of the file to write.
+    :param mode: The mode in which to open the temporary file, e.g. ``'wb'``.
+    :param copy_mode: ``True`` to give the new file the permission bits of
+        the existing file at ``path``.
+    """
+    
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory or None, prefix=f'.{name}.', suffix='.tmp')
+    
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        
+        if copy_mode:
+            shutil.copymode(path, temp_path)
+        
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def read_json(path, expected_type=None):
+    """
+    Return the data stored in the JSON file at the given path. Return
+    ``None`` if the file does not exist or cannot be read, or if the data
+    is not an instance of ``expected_type``, if given.
+    
+    :param path: The path of the JSON file.
+    :param expected_type: An optional type the data must be an instance of,
+        e.g. ``dict``.
+    :return: The decoded data, or ``None``.
+    """
+    
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if expected_type is not None and not isinstance(data, expected_type):
+        return None
+    
+    return data
+
+
+def atomic_write_json(path, data, **kwargs):
+    """
+    Write the given data to the JSON file at the given path, atomically
+    replacing any existing file. See :func:`atomic_write`.
+    
+    :param path: The path of the JSON file.
+    :param data: The JSON-serialisable data to write.
+    :param kwargs: Additional keyword arguments for ``json.dump()``.
+    """
+    
+    with atomic_write(path) as f:
+        json.dump(data, f, **kwargs)
+
+
+class FileIndex:
+    """
+    A persistent index of file metadata, used to avoid re-processing files
+    that have not changed since they were last processed. Each file's
+    modification time, size, and inode are stored along with the result of
+    processing it, for any number of "consumers" (e.g. different checks).
+    A stored result is only returned if the file's metadata still matches.
+    
+    Each consumer provides a ``signature`` describing anything that affects
+    its results, e.g. its configuration. If the signature differs from the
+    one stored with the index, all of the consumer's stored results are
+    discarded, forcing every file to be processed again.
+    
+    Usage::
+    
+        index = FileIndex(path, 'my_check', signature={'option': value})
+        for entry in scan('./'):
+            stat = entry.stat()
+            try:
+                result = index.get(entry.path, stat)
+            except KeyError:
+                result = check(entry.path)
+                index.set(entry.path, stat, result)
+        
+        index.save()
+    
+    :param path: The path of the index file. It is created if it does not
+        exist.
+    :param consumer: The name of the consumer using the index.
+    :param signature: A JSON-serialisable value describing anything that
+        affects the consumer's results.
+    """
+    
+    def __init__(self, path, consumer, signature=None):
+        
+        self.path = path
+        self.consumer = consumer
+        self.signature = signature
+        self.seen = set()
+        
+        data = read_json(path, dict) or {}
+        if data.get('version') != FILE_INDEX_VERSION:
+            data = {}
+        
+        self.signatures = data.get('signatures', {})
+        self.files = data.get('files', {})
+        
+        if self.signatures.get(consumer) != signature:
+            self.signatures[consumer] = signature
+            for record in self.files.values():
+                record[3].pop(consumer, None)
+    
+    def get(self, path, stat):
+        """
+        Return the consumer's stored result for the file at the given path,
+        if the given ``os.stat_result`` for it matches the stored metadata.
+        Raise ``KeyError`` if there is no matching result.
+        """
+        
+        self.seen.add(path)
+        
+        mtime_ns, size, inode, results = self.files[path]
+        if (mtime_ns, size, inode) != (stat.st_mtime_ns, stat.st_size, stat.st_ino):
+            raise KeyError(path)
+        
+        return results[self.consumer]
+    
+    def set(self, path, stat, result):
+        """
+        Store the consumer's result for the file at the given path, along with
+        the given ``os.stat_result`` for it. If the file has changed since it
+        was last indexed, the results of other consumers are discarded.
+        """
+        
+        self.seen.add(path)
+        
+        metadata = [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+        
+        record = self.files.get(path)
+        if not record or record[:3] != metadata:
+            record = self.files[path] = [*metadata, {}]
+        
+        record[3][self.consumer] = result
+    
+    def save(self, prune=True):
+        """
+        Write the index to disk. The file is replaced atomically, so it is
+        never left partially written, even if multiple processes update it.
+        
+        :param prune: ``True`` to discard the consumer's results for any file
+            not accessed via :meth:`get` or :meth:`set` since the index was
+            loaded, e.g. because it has been deleted. Only use this if the
+            consumer has processed all relevant files.
+        """
+        
+        files = self.files
+        
+        if prune:
+            consumer = self.consumer
+            seen = self.seen
+            for path in [p for p in files if p not in seen]:
+                results = files[path][3]
+                results.pop(consumer, None)
+                if not results:
+                    del files[path]
+        
+        data = {
+            'version': FILE_INDEX_VERSION,
+            'signatures': self.signatures,
+            'files': files
+        }
+        
+        atomic_write_json(self.path, data, separators=(',', ':'))
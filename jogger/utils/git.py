@@ -0,0 +1,159 @@
+import os
+import subprocess
+
+from .config import STATE_DIR_NAME
+
+DEFAULT_BRANCH_NAME = 'main'
+
+
+def run_git(*args, cwd=None):
+    """
+    Run the given ``git`` command and return its output, as bytes. Return
+    ``None`` if the command fails, e.g. because ``git`` is not installed or
+    the directory is not within a git repository.
+    
+    :param args: The arguments to the ``git`` command, as individual strings.
+    :param cwd: The directory to run the command in. Defaults to the current
+        working directory.
+    :return: The output of the command, or ``None``.
+    """
+    
+    try:
+        result = subprocess.run(['git', *args], capture_output=True, cwd=cwd)  # noqa: S603 S607
+    except OSError:
+        return None
+    
+    if result.returncode:
+        return None
+    
+    return result.stdout
+
+
+def split_paths(output, from_path='.'):
+    """
+    Split the NUL-separated output of a ``git`` command run with ``-z`` into
+    a list of paths, relative to ``from_path``. Paths are joined to
+    ``from_path`` in the same format as paths yielded by
+    :func:`~jogger.utils.files.walk`, e.g. ``./src/app.py``.
+    """
+    
+    return [
+        os.path.join(from_path, os.path.normpath(path))
+        for path in output.decode('utf-8', errors='surrogateescape').split('\0')
+        if path
+    ]
+
+
+def list_files(from_path='.', untracked=False):
+    """
+    Return the paths of all files tracked by git under the ``from_path``
+    directory, optionally including untracked files that are not ignored
+    (e.g. by ``.gitignore``). Paths are in the same format as those yielded
+    by :func:`~jogger.utils.files.walk`. Return ``None`` if ``from_path`` is
+    not within a git repository.
+    
+    :param from_path: The directory to list files under.
+    :param untracked: ``True`` to include untracked files.
+    :return: A list of file paths, or ``None``.
+    """
+    
+    args = ['ls-files', '-z', '--cached']
+    if untracked:
+        args.extend(('--others', '--exclude-standard'))
+    
+    output = run_git(*args, cwd=from_path)
+    if output is None:
+        return None
+    
+    return split_paths(output, from_path)
+
+
+def get_merge_base(ref, cwd=None):
+    """
+    Return the hash of the best common ancestor of ``HEAD`` and the given
+    ``ref`` (e.g. a branch name), as a string. Return ``None`` if it cannot
+    be determined, e.g. because ``ref`` does not exist.
+    """
+    
+    output = run_git('merge-base', 'HEAD', ref, cwd=cwd)
+    if not output:
+        return None
+    
+    return output.decode('utf-8').strip()
+
+
+def list_changed_files(from_path='.', ref=None, staged=False, deleted=False):
+    """
+    Return the paths of all files under the ``from_path`` directory that have
+    been added or modified, in the same format as those yielded by
+    :func:`~jogger.utils.files.walk`. Deleted files are only included if
+    ``deleted`` is ``True``. Return ``None`` if ``from_path`` is not within
+    a git repository, or ``ref`` is not a valid git reference.
+    
+    :param from_path: The directory to list files under.
+    :param ref: The git reference (e.g. a branch name or commit hash) to
+        compare the working tree to. Untracked files that are not ignored
+        (e.g. by ``.gitignore``) are also included. Defaults to ``HEAD``.
+    :param staged: ``True`` to list only files with changes staged in the
+        index, compared to ``HEAD``. ``ref`` is ignored.
+    :param deleted: ``True`` to include deleted files.
+    :return: A list of file paths, or ``None``.
+    """
+    
+    args = ['diff', '--name-only', '-z', '--relative', '--no-renames']
+    if not deleted:
+        args.append('--diff-filter=d')
+    
+    if staged:
+        args.append('--cached')
+    else:
+        args.append(ref or 'HEAD')
+    
+    # Separate the ref from paths, in case they share a name
+    args.append('--')
+    
+    output = run_git(*args, cwd=from_path)
+    if output is None:
+        return None
+    
+    paths = split_paths(output, from_path)
+    
+    if not staged:
+        output = run_git('ls-files', '-z', '--others', '--exclude-standard', cwd=from_path)
+        if output is None:
+            return None
+        
+        paths.extend(split_paths(output, from_path))
+    
+    return paths
+
+
+def find_changed_files(from_path='.', ref=None, branch_name=DEFAULT_BRANCH_NAME, staged=False, deleted=False):
+    """
+    Return the paths of all files under the ``from_path`` directory that have
+    changed, as per :func:`list_changed_files`, but comparing to the merge
+    base with the ``branch_name`` branch if neither ``ref`` nor ``staged`` is
+    given. Files within ``jogger`` state directories are excluded. Raise
+    ``ValueError`` if the merge base cannot be found, or if the files cannot
+    be listed.
+    
+    :param from_path: The directory to list files under.
+    :param ref: The git reference to compare the working tree to.
+    :param branch_name: The name of the branch to find the merge base with,
+        if ``ref`` is not given.
+    :param staged: ``True`` to list only files with changes staged in the
+        index, compared to ``HEAD``.
+    :param deleted: ``True`` to include deleted files.
+    :return: A list of file paths.
+    """
+    
+    if not staged and not ref:
+        ref = get_merge_base(branch_name, cwd=from_path)
+        if not ref:
+            raise ValueError(f'Could not find the merge base with the "{branch_name}" branch.')
+    
+    paths = list_changed_files(from_path, ref, staged, deleted)
+    if paths is None:
+        raise ValueError('Could not list changed files: Not a git repository, or invalid reference.')
+    
+    return [path for path in paths if STATE_DIR_NAME not in path.split(os.sep)]
@@ -0,0 +1,631 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+
+from . import events
+
+HISTORY_FILE_NAME = 'history.sqlite3'
+DEFAULT_STATS_LIMIT = 20
+DEFAULT_STATS_STEP_LIMIT = 5
+
+DEFAULT_BASELINE_RUNS = 10
+DEFAULT_DURATION_THRESHOLD = 50  # percent
+MIN_BASELINE_RUNS = 3
+MIN_DURATION_REGRESSION = 1  # seconds
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    args TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    status INTEGER NOT NULL,
+    interactive INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_task_started ON runs (task, started);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    task TEXT NOT NULL,
+    step TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    outcome INTEGER,
+    interactive INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS steps_run_id ON steps (run_id);
+'''
+
+
+def percentile(values, pct):
+    """
+    Return the ``pct`` percentile of the given sequence of ``values``, using
+    the nearest-rank method. Return ``None`` if ``values`` is empty.
+    """
+    
+    if not values:
+        return None
+    
+    values = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    
+    return values[rank - 1]
+
+
+class RunHistory:
+    """
+    An interface to the SQLite database storing the history of task runs for
+    a project, including the duration and exit status of each run, and the
+    duration and outcome of the individual steps of each run (for tasks that
+    report steps).
+    
+    :param path: The path to the database file. It will be created if it
+        does not exist.
+    """
+    
+    def __init__(self, path):
+        
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.migrate()
+    
+    def migrate(self):
+        """
+        Add any columns missing from the tables of a database created by an
+        earlier version.
+        """
+        
+        with self.connection:
+            for table in ('runs', 'steps'):
+                columns = {row[1] for row in self.connection.execute(f'PRAGMA table_info({table})')}
+                if 'interactive' not in columns:
+                    self.connection.execute(
+                        f'ALTER TABLE {table} ADD COLUMN interactive INTEGER NOT NULL DEFAULT 0'
+                    )
+    
+    def close(self):
+        
+        self.connection.close()
+    
+    def record_run(self, task, args, started, duration, status, steps=(), interactive=False):
+        """
+        Record a run of the given task.
+        
+        :param task: The task name.
+        :param args: The list of arguments passed to the task.
+        :param started: The time the run started, as a UNIX timestamp.
+        :param duration: The duration of the run, in seconds.
+        :param status: The exit status of the run.
+        :param steps: An iterable of
+            ``(task, step, started, duration, outcome, interactive)`` tuples
+            describing the steps performed during the run.
+        :param interactive: ``True`` if the run included any interactive
+            steps, i.e. steps that waited for user input.
+        """
+        
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (task, args, started, duration, status, interactive) VALUES (?, ?, ?, ?, ?, ?)',
+                (task, json.dumps(args), started, duration, status, interactive)
+            )
+            
+            run_id = cursor.lastrowid
+            
+            self.connection.executemany(
+                'INSERT INTO steps (run_id, task, step, started, duration, outcome, interactive) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((run_id, *step) for step in steps)
+            )
+    
+    def get_task_names(self):
+        """
+        Return the names of all tasks with recorded runs.
+        """
+        
+        cursor = self.connection.execute('SELECT DISTINCT task FROM runs ORDER BY task')
+        
+        return [row[0] for row in cursor]
+    
+    def get_runs(self, task, limit, offset=0, successful=False):
+        """
+        Return the most recent runs of the given task, newest first, as a
+        list of ``(id, started, duration, status)`` tuples.
+        
+        :param task: The task name.
+        :param limit: The maximum number of runs to return.
+        :param offset: The number of the most recent runs to skip.
+        :param successful: ``True`` to only include runs that exited with a
+            status of ``0`` and did not wait for user input, i.e. those with
+            comparable durations.
+        """
+        
+        status_filter = 'AND status = 0 AND NOT interactive' if successful else ''
+        
+        cursor = self.connection.execute(
+            f'SELECT id, started, duration, status FROM runs WHERE task = ? {status_filter} '  # noqa: S608
+            'ORDER BY started DESC LIMIT ? OFFSET ?',
+            (task, limit, offset)
+        )
+        
+        return cursor.fetchall()
+    
+    def get_baseline_durations(self, task, step=None, limit=DEFAULT_BASELINE_RUNS, args=None):
+        """
+        Return the durations of the most recent successful runs of the given
+        task or, if ``step`` is given, of the most recent successful instances
+        of that step of the task. Steps with an outcome of ``None`` (skipped)
+        are not considered successful. Interactive runs and steps are
+        excluded, as their durations include time spent waiting for input.
+        
+        :param task: The task name.
+        :param step: The step name, if any.
+        :param limit: The maximum number of durations to return.
+        :param args: An optional list of arguments. If given, only runs
+            passed exactly the same arguments are included, as arguments can
+            change how much work a run does (e.g. ``lint --changed``).
+        :return: A list of durations, newest first.
+        """
+        
+        if step is None:
+            query = (
+                'SELECT runs.duration, runs.started FROM runs '
+                'WHERE runs.task = ? AND runs.status = 0 AND NOT runs.interactive'
+            )
+            params = [task]
+        else:
+            query = (
+                'SELECT steps.duration, steps.started FROM steps JOIN runs ON runs.id = steps.run_id '
+                'WHERE steps.task = ? AND steps.step = ? AND steps.outcome = 1 AND NOT steps.interactive'
+            )
+            params = [task, step]
+        
+        if args is not None:
+            query = f'{query} AND runs.args = ?'
+            params.append(json.dumps(args))
+        
+        cursor = self.connection.execute(f'{query} ORDER BY 2 DESC LIMIT ?', (*params, limit))
+        
+        return [row[0] for row in cursor]
+    
+    def get_step_durations(self, run_ids):
+        """
+        Return a dictionary mapping ``(task, step)`` tuples to lists of the
+        durations recorded for that step in the given runs, excluding any
+        interactive steps.
+        """
+        
+        placeholders = ', '.join('?' * len(run_ids))
+        cursor = self.connection.execute(
+            f'SELECT task, step, duration FROM steps WHERE run_id IN ({placeholders}) AND NOT interactive',  # noqa: S608
+            tuple(run_ids)
+        )
+        
+        durations = {}
+        for task, step, duration in cursor:
+            durations.setdefault((task, step), []).append(duration)
+        
+        return durations
+
+
+def format_duration(seconds):
+    """
+    Return the given duration, in seconds, as a human-readable string.
+    """
+    
+    if seconds is None:
+        return '-'
+    elif seconds < 10:
+        return f'{seconds:.2f}s'
+    elif seconds < 60:
+        return f'{seconds:.1f}s'
+    
+    minutes, seconds = divmod(round(seconds), 60)
+    
+    return f'{minutes}m {seconds:02}s'
+
+
+def write_stats(history, stdout, task_names=None, limit=DEFAULT_STATS_LIMIT):
+    """
+    Write a report of the recorded runs of the given tasks (or all tasks with
+    recorded runs) to the given ``OutputWrapper``. For each task, report the
+    median (p50) and 95th percentile (p95) durations of the last ``limit``
+    successful runs, compared to the ``limit`` runs before that, and the
+    slowest steps of those runs.
+    """
+    
+    styler = stdout.styler
+    
+    if not task_names:
+        task_names = history.get_task_names()
+    
+    if not task_names:
+        stdout.write('No task runs recorded.')
+        return
+    
+    for task in task_names:
+        stdout.write(styler.heading(task))
+        
+        runs = history.get_runs(task, limit)
+        if not runs:
+            stdout.write('No runs recorded\n')
+            continue
+        
+        failures = sum(1 for run in runs if run[3] != 0)
+        plural = 's' if len(runs) != 1 else ''
+        summary = f'Last {len(runs)} run{plural}: {len(runs) - failures} OK'
+        if failures:
+            summary = f'{summary}, {styler.error(f"{failures} failed")}'
+        
+        stdout.write(summary)
+        
+        recent = history.get_runs(task, limit, successful=True)
+        previous = history.get_runs(task, limit, offset=len(recent), successful=True)
+        
+        recent_durations = [run[2] for run in recent]
+        previous_durations = [run[2] for run in previous]
+        
+        for pct in (50, 95):
+            stdout.write(_format_percentile(styler, pct, recent_durations, previous_durations))
+        
+        _write_slowest_steps(history, stdout, task, [run[0] for run in recent])
+        
+        stdout.write('')  # newline
+
+
+def _format_percentile(styler, pct, durations, previous_durations):
+    
+    # Describe the given percentile of the given durations, compared to the
+    # same percentile of the previous durations, if any
+    current = percentile(durations, pct)
+    line = f'Duration p{pct}: {format_duration(current)}'
+    
+    before = percentile(previous_durations, pct)
+    if current is None or not before:
+        return line
+    
+    change = (current - before) / before * 100
+    styled_change = f'{change:+.0f}%'
+    if change > 10:
+        styled_change = styler.warning(styled_change)
+    elif change < -10:
+        styled_change = styler.success(styled_change)
+    
+    return f'{line} ({styled_change} vs {format_duration(before)} in the {len(previous_durations)} runs before)'
+
+
+def _write_slowest_steps(history, stdout, task, run_ids):
+    
+    step_durations = history.get_step_durations(run_ids)
+    if not step_durations:
+        return
+    
+    stdout.write('Slowest steps (p50 / p95):')
+    
+    step_stats = []
+    for (step_task, step), durations in step_durations.items():
+        label = step if step_task == task else f'{step_task}:{step}'
+        step_stats.append((percentile(durations, 50), percentile(durations, 95), label))
+    
+    step_stats.sort(reverse=True)
+    for p50, p95, label in step_stats[:DEFAULT_STATS_STEP_LIMIT]:
+        stdout.write(f'    {label}: {format_duration(p50)} / {format_duration(p95)}')
+
+
+def write_plan(history, stdout, task, steps, limit=DEFAULT_BASELINE_RUNS, args=None):
+    """
+    Write the given ``steps`` of the given task to the given ``OutputWrapper``,
+    along with an estimate of the duration of each, and of the task as a
+    whole. Estimates are the median durations of the most recent ``limit``
+    successful runs recorded in the given ``RunHistory``, if any, that were
+    passed the given ``args`` (if not ``None``).
+    """
+    
+    styler = stdout.styler
+    
+    def get_estimate(step=None):
+        
+        if not history:
+            return None
+        
+        durations = history.get_baseline_durations(task, step, limit, args)
+        if not durations:
+            return None
+        
+        return percentile(durations, 50)
+    
+    stdout.write(f'Plan for {styler.heading(task)}', style='label')
+    
+    step_estimates = [get_estimate(step) for step in steps]
+    
+    if not steps:
+        stdout.write('No distinct steps reported')
+    else:
+        width = max(len(step) for step in steps)
+        
+        for i, (step, estimate) in enumerate(zip(steps, step_estimates), start=1):
+            if estimate is None:
+                estimate = 'no estimate'
+            else:
+                estimate = f'~{format_duration(estimate)}'
+            
+            stdout.write(f'{i:>3}. {step.ljust(width)}  {estimate}')
+    
+    # Prefer the total of the step estimates, if available, as the steps to
+    # be run may differ from those of previous runs
+    if steps and None not in step_estimates:
+        estimate = sum(step_estimates)
+        basis = 'total of step estimates'
+    else:
+        estimate = get_estimate()
+        basis = 'median of recent successful runs'
+    
+    if estimate is None:
+        stdout.write('\nEstimated duration: unknown (no successful runs recorded)')
+    else:
+        stdout.write(f'\nEstimated duration: ~{format_duration(estimate)} ({basis})')
+
+
+class HistoryRecorder:
+    """
+    A context manager that records the events emitted while it is active
+    into the project's :class:`RunHistory`. Each execution of a top-level task
+    is recorded as a single run. Steps reported by the task, and by any
+    nested tasks it executes, are recorded against that run.
+    
+    Recording is skipped for tasks that disable it via the
+    ``record_history`` setting, and for runs that exit early with a status of
+    ``0`` (e.g. ``UpdateTask`` finding no remote changes). Runs including any
+    interactive steps, and those steps themselves, are recorded with an
+    ``interactive`` flag, excluding their durations from baselines, estimates
+    and statistics.
+    
+    :param conf: The ``JogConf`` instance for the project.
+    :param stderr: An ``OutputWrapper`` to which to write any errors
+        encountered while recording the run.
+    """
+    
+    def __init__(self, conf, stderr):
+        
+        self.conf = conf
+        self.stderr = stderr
+        self.depth = 0
+        self.run = None
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        
+        events.add_listener(self)
+        
+        return self
+    
+    def __exit__(self, *args):
+        
+        events.remove_listener(self)
+    
+    def __call__(self, event):
+        
+        # Look up the handler before acquiring the lock, so that other events
+        # (e.g. a "warning" written by a handler) are ignored without blocking
+        handler = getattr(self, f'handle_{event["event"]}', None)
+        if handler:
+            with self._lock:
+                handler(event)
+    
+    def handle_task_start(self, event):
+        
+        self.depth += 1
+        if self.depth > 1:
+            return  # a nested task
+        
+        task = event['task']
+        if self.conf.get_task_settings(task).get('record_history', True):
+            self.run = {
+                'task': task,
+                'args': event['args'],
+                'started': event['time'],
+                'steps': [],
+                'interactive': False
+            }
+    
+    def handle_step_end(self, event):
+        
+        if not self.run:
+            return
+        
+        # The duration of a step waiting for user input is meaningless, as
+        # is that of the run as a whole
+        interactive = bool(event.get('interactive'))
+        if interactive:
+            self.run['interactive'] = True
+        
+        duration = event['duration']
+        self.run['steps'].append(
+            (event['task'], event['step'], event['time'] - duration, duration, event.get('outcome'), interactive)
+        )
+    
+    def handle_task_end(self, event):
+        
+        self.depth -= 1
+        if self.depth or not self.run:
+            return
+        
+        run, self.run = self.run, None
+        
+        if event.get('exited') and not event['status']:
+            return  # a no-op run
+        
+        try:
+            history = RunHistory(self.conf.get_state_path(HISTORY_FILE_NAME))
+            try:
+                history.record_run(duration=event['duration'], status=event['status'], **run)
+            finally:
+                history.close()
+        except (OSError, sqlite3.Error) as e:
+            self.stderr.write(f'Could not record task history: {e}', style='warning')
+    
+    def report(self, stdout):
+        
+        # Nothing to report, runs are recorded silently
+        pass
+
+
+class DurationMonitor:
+    """
+    A context manager that monitors the durations of tasks and steps that
+    complete successfully while it is active, comparing each to a baseline:
+    the median duration of recent successful runs recorded in the project's
+    :class:`RunHistory`, passed the same arguments as the current run. A
+    warning is displayed for any that exceed the baseline by more than a
+    threshold percentage.
+    
+    Only top-level tasks are monitored, along with the steps of any task.
+    Tasks that exit early with a status of ``0``, and interactive steps (and
+    the tasks that include them), are not monitored, as they are excluded
+    from the baselines as well.
+    The following task settings control the behaviour of the monitor:
+    
+    - ``duration_threshold``: The percentage by which a duration must exceed
+      the baseline to trigger a warning. Defaults to ``50``. Use ``0`` to
+      disable monitoring.
+    - ``duration_baseline_runs``: The number of recent runs to include in the
+      baseline. Defaults to ``10``.
+    - ``duration_strict``: ``True`` to treat any warnings as a failure of the
+      task. See :attr:`failed`.
+    
+    :param conf: The ``JogConf`` instance for the project.
+    :param stdout: An ``OutputWrapper`` to which to write any warnings.
+    """
+    
+    def __init__(self, conf, stdout):
+        
+        self.conf = conf
+        self.stdout = stdout
+        self.depth = 0
+        self.args = None
+        self.interactive = False
+        self.regressions = []
+        self._settings = {}
+        self._lock = threading.Lock()
+        
+        path = os.path.join(conf.state_dir, HISTORY_FILE_NAME)
+        self.history_path = path if os.path.exists(path) else None
+    
+    def __enter__(self):
+        
+        events.add_listener(self)
+        
+        return self
+    
+    def __exit__(self, *args):
+        
+        events.remove_listener(self)
+    
+    def __call__(self, event):
+        
+        kind = event['event']
+        
+        # Ignore other events before acquiring the lock. A duration warning
+        # is itself emitted as a "warning" event while the lock is held.
+        if kind not in ('task_start', 'task_end', 'step_end'):
+            return
+        
+        with self._lock:
+            if kind == 'task_start':
+                self.depth += 1
+                if self.depth == 1:
+                    self.args = event['args']
+                    self.interactive = False
+            elif kind == 'task_end':
+                self.depth -= 1
+                if not self.depth and not event['status'] and not event.get('exited') and not self.interactive:
+                    self.check(event['task'], None, event['duration'])
+            elif event.get('interactive'):
+                self.interactive = True
+            elif kind == 'step_end' and event.get('outcome') and not event['status']:
+                self.check(event['task'], event['step'], event['duration'])
+    
+    @property
+    def failed(self):
+        """
+        ``True`` if any of the monitored durations exceeded their baseline
+        for a task using the ``duration_strict`` setting.
+        """
+        
+        return any(self.get_settings(task)[2] for task, _, _, _ in self.regressions)
+    
+    def get_settings(self, task):
+        
+        try:
+            return self._settings[task]
+        except KeyError:
+            pass
+        
+        settings = self.conf.get_task_settings(task)
+        
+        try:
+            threshold = float(settings.get('duration_threshold', DEFAULT_DURATION_THRESHOLD))
+            runs = int(settings.get('duration_baseline_runs', DEFAULT_BASELINE_RUNS))
+        except ValueError:
+            self.stdout.write(f'Invalid duration monitoring settings for task "{task}".', style='warning')
+            threshold = runs = 0
+        
+        strict = settings.get('duration_strict', False) is True
+        
+        self._settings[task] = (threshold, runs, strict)
+        
+        return self._settings[task]
+    
+    def check(self, task, step, duration):
+        """
+        Compare the given duration of a task, or a step of a task, to its
+        baseline and warn if it exceeds the baseline by more than the
+        threshold configured for the task.
+        """
+        
+        if not self.history_path:
+            return  # no history, no baseline
+        
+        threshold, runs, strict = self.get_settings(task)
+        if threshold <= 0 or runs <= 0:
+            return
+        
+        try:
+            history = RunHistory(self.history_path)
+            try:
+                durations = history.get_baseline_durations(task, step, runs, self.args)
+            finally:
+                history.close()
+        except sqlite3.Error:
+            return
+        
+        if len(durations) < MIN_BASELINE_RUNS:
+            return
+        
+        baseline = percentile(durations, 50)
+        increase = duration - baseline
+        
+        # Ignore small absolute differences, regardless of the percentage,
+        # to avoid flagging noise in very short durations
+        if not baseline or increase < MIN_DURATION_REGRESSION or increase / baseline * 100 <= threshold:
+            return
+        
+        self.regressions.append((task, step, duration, baseline))
+        
+        subject = f'Task "{task}"' if step is None else f'Step "{step}" of task "{task}"'
+        self.stdout.write(
+            f'\nDuration warning: {subject} took {format_duration(duration)}, '
+            f'{increase / baseline * 100:.0f}% longer than the median of the last '
+            f'{len(durations)} successful runs ({format_duration(baseline)})',
+            style='warning'
+        )
+    
+    def report(self, stdout):
+        
+        if self.failed:
+            stdout.write(
+                'Duration warnings are treated as failures (duration_strict = true)',
+                style='error'
+            )
@@ -0,0 +1,170 @@
+import ast
+import os
+from collections import defaultdict
+
+from .files import scan
+
+IMPORT_GRAPH_CONSUMER = 'imports'
+IMPORT_INDEX_NAME = 'import_index.json'
+
+
+def get_module_name(path):
+    """
+    Return the dotted name of the module at the given file path, relative to
+    the current working directory, e.g. ``./myapp/models.py`` becomes
+    ``myapp.models`` and ``./myapp/__init__.py`` becomes ``myapp``. Paths of
+    other types of files are converted in the same way, e.g.
+    ``./myapp/templates/index.html`` becomes ``myapp.templates.index``.
+    """
+    
+    path = os.path.splitext(os.path.normpath(path))[0]
+    parts = [part for part in path.split(os.sep) if part not in ('', os.curdir)]
+    
+    if parts and parts[-1] == '__init__':
+        parts.pop()
+    
+    return '.'.join(parts)
+
+
+def parse_imports(source, module_name, is_package=False):
+    """
+    Return the absolute names of everything imported by the given Python
+    source code, including imports within functions. For ``from`` imports,
+    both the module and each imported name are included, as the names may
+    be submodules. Relative imports are resolved using ``module_name``.
+    
+    :param source: The source code, as a string or bytes.
+    :param module_name: The dotted name of the module the source belongs to.
+    :param is_package: ``True`` if the source is the ``__init__.py`` file of
+        a package.
+    :return: A sorted list of dotted names.
+    """
+    
+    tree = ast.parse(source)
+    
+    package = module_name.split('.') if is_package else module_name.split('.')[:-1]
+    names = set()
+    
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                # Ignore relative imports beyond the top-level package
+                if node.level - 1 > len(package):
+                    continue
+                
+                parts = package[:len(package) - node.level + 1]
+                if node.module:
+                    parts.append(node.module)
+                
+                base = '.'.join(parts)
+            else:
+                base = node.module
+            
+            if base:
+                names.add(base)
+            
+            for alias in node.names:
+                if alias.name != '*':
+                    names.add(f'{base}.{alias.name}' if base else alias.name)
+    
+    return sorted(names)
+
+
+class ImportGraph:
+    """
+    A static graph of the imports between the Python modules of a project,
+    built by parsing (but not importing) each module.
+    
+    :param imports: A dictionary mapping the dotted name of each module to
+        an iterable of the names it imports.
+    """
+    
+    def __init__(self, imports):
+        
+        self.imports = imports
+        self.importers = defaultdict(set)
+        
+        for module, names in imports.items():
+            for name in names:
+                # Importing a module also imports its parent packages
+                parts = name.split('.')
+                for i in range(len(parts), 0, -1):
+                    target = '.'.join(parts[:i])
+                    if target != module:
+                        self.importers[target].add(module)
+    
+    @classmethod
+    def build(cls, from_path, exclude_patterns=None, index=None):
+        """
+        Build the graph of all Python modules under the ``from_path``
+        directory, which should be the directory modules are imported
+        relative to (e.g. the project directory).
+        
+        Modules that cannot be parsed, e.g. due to syntax errors, are
+        included without any imports.
+        
+        :param from_path: The directory to find modules in.
+        :param exclude_patterns: An iterable of patterns to exclude files
+            and directories from the graph, as per
+            :func:`~jogger.utils.files.scan`.
+        :param index: An optional :class:`~jogger.utils.files.FileIndex`
+            used to reuse the imports of modules that have not changed since
+            they were last parsed. It is saved once the graph is built.
+        :return: The ``ImportGraph`` instance.
+        """
+        
+        imports = {}
+        
+        for entry in scan(from_path, exclude_patterns):
+            if not entry.name.endswith('.py'):
+                continue
+            
+            path = entry.path
+            stat = entry.stat()
+            module_name = get_module_name(os.path.relpath(path, from_path))
+            
+            names = None
+            if index:
+                try:
+                    names = index.get(path, stat)
+                except KeyError:
+                    pass
+            
+            if names is None:
+                try:
+                    with open(path, 'rb') as f:
+                        names = parse_imports(f.read(), module_name, entry.name == '__init__.py')
+                except (OSError, SyntaxError, ValueError):
+                    names = []
+                
+                if index:
+                    index.set(path, stat, names)
+            
+            imports[module_name] = names
+        
+        if index:
+            index.save()
+        
+        return cls(imports)
+    
+    def get_dependents(self, names):
+        """
+        Return the names of all modules that import any of the given modules,
+        directly or indirectly, along with the given names themselves.
+        
+        :param names: An iterable of dotted module names.
+        :return: A set of dotted module names.
+        """
+        
+        dependents = set(names)
+        stack = list(dependents)
+        
+        while stack:
+            for importer in self.importers.get(stack.pop(), ()):
+                if importer not in dependents:
+                    dependents.add(importer)
+                    stack.append(importer)
+        
+        return dependents
@@ -0,0 +1,138 @@
+import atexit
+import glob
+import gzip
+import io
+import os
+import time
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+DEFAULT_LOG_MAX_COUNT = 30
+
+COMPRESSION_EXTENSIONS = {
+    'zstd': '.zst',
+    'gzip': '.gz',
+    'none': '',
+}
+
+
+def get_default_compression():
+    
+    return 'zstd' if zstd else 'gzip'
+
+
+def get_log_paths(log_dir, task_name):
+    """
+    Return the paths of all existing run logs for the given task in the given
+    directory, oldest first.
+    """
+    
+    # Log file names begin with a timestamp following the task name, so
+    # sorting by name also sorts by age
+    return sorted(glob.glob(os.path.join(glob.escape(log_dir), f'{task_name}-*.log*')))
+
+
+def rotate_logs(log_dir, task_name, max_count=DEFAULT_LOG_MAX_COUNT, max_size=0):
+    """
+    Delete the oldest run logs for the given task in the given directory,
+    such that no more than ``max_count`` logs remain and their combined size
+    does not exceed ``max_size`` bytes. The most recent log is always kept.
+    A value of ``0`` for either limit disables it.
+    """
+    
+    paths = get_log_paths(log_dir, task_name)
+    
+    if max_count and len(paths) > max_count:
+        for path in paths[:-max_count]:
+            os.remove(path)
+        
+        paths = paths[-max_count:]
+    
+    if max_size:
+        sizes = [os.path.getsize(path) for path in paths]
+        total = sum(sizes)
+        for path, size in zip(paths[:-1], sizes):
+            if total <= max_size:
+                break
+            
+            os.remove(path)
+            total -= size
+
+
+def open_run_log(log_dir, task_name, compression=None):
+    """
+    Create a new log file for a single run of the given task in the given
+    directory, and return a text stream for writing to it. The file is
+    compressed as it is written, using the given ``compression`` method:
+    ``'zstd'`` (requires Python 3.14+ or the ``zstandard`` package),
+    ``'gzip'``, or ``'none'``. Defaults to ``'zstd'`` if available, otherwise
+    ``'gzip'``.
+    
+    The stream is closed automatically when the process exits, ensuring the
+    compressed file is complete.
+    
+    :param log_dir: The directory to create the log file in.
+    :param task_name: The name of the task being run.
+    :param compression: The compression method to use.
+    :return: The text stream.
+    """
+    
+    compression = compression or get_default_compression()
+    
+    try:
+        extension = COMPRESSION_EXTENSIONS[compression]
+    except KeyError:
+        raise ValueError(f'Unknown log compression method "{compression}".')
+    
+    if compression == 'zstd' and not zstd:
+        raise ValueError('zstd log compression requires Python 3.14+ or the zstandard package.')
+    
+    os.makedirs(log_dir, exist_ok=True)
+    
+    timestamp = time.strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(log_dir, f'{task_name}-{timestamp}-{os.getpid()}.log{extension}')
+    
+    if compression == 'zstd':
+        raw = zstd.open(path, 'wb')
+    elif compression == 'gzip':
+        raw = gzip.GzipFile(path, 'wb')
+    else:
+        raw = open(path, 'wb')
+    
+    stream = RunLog(raw, path)
+    atexit.register(stream.close)
+    
+    return stream
+
+
+class RunLog(io.TextIOWrapper):
+    """
+    A text stream writing to a (possibly compressed) run log file. Unlike the
+    streams of the underlying compression libraries, it reliably exposes the
+    ``name`` of the log file.
+    
+    It deliberately does not expose a file descriptor, as anything written
+    to it directly would bypass compression. Output from subprocesses must
+    be piped through it instead (as :meth:`~jogger.tasks.base.Task.cli`
+    does). This also ensures all output is written in the order it occurs.
+    """
+    
+    def __init__(self, raw, path):
+        
+        super().__init__(raw, encoding='utf-8', errors='replace')
+        self._path = path
+    
+    @property
+    def name(self):
+        
+        return self._path
+    
+    def fileno(self):
+        
+        raise io.UnsupportedOperation('Run logs do not support fileno().')
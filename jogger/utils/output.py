@@ -1,8 +1,12 @@
 import os
 import sys
+import threading
+import time
 from inspect import cleandoc
 from io import TextIOBase
 
+from . import events
+
 #
 # This module is heavily based on Django, adapted from functionality found in
 # ``django.core.management.base``, ``django.core.management.color``, and
@@ -16,6 +20,10 @@ BACKGROUND = {COLOR_NAMES[x]: '4%s' % x for x in range(8)}
 OPTIONS = {'bold': '1', 'underscore': '4', 'blink': '5', 'reverse': '7', 'conceal': '8'}
 RESET = '\x1b[0m'
 
+# The Progress instance currently reporting progress, if any. Only one
+# progress report can be displayed at a time.
+_active_progress = None
+
 
 def clean_description(description, collapse_paragraphs=True):
     
@@ -39,6 +47,20 @@ def clean_description(description, collapse_paragraphs=True):
     return description
 
 
+def format_size(size):
+    """
+    Return the given ``size``, in bytes, as a human-readable string.
+    """
+    
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size:.0f} {unit}'
+        
+        size /= 1024
+    
+    return f'{size:.1f} GiB'
+
+
 class Styler:
     """
     An object containing methods for generating styled text for a palette of
@@ -201,13 +223,232 @@ class OutputWrapper(TextIOBase):
         
         return supported_platform and is_a_tty
     
+    def isatty(self):
+        
+        return hasattr(self._out, 'isatty') and self._out.isatty()
+    
+    def progress(self, label):
+        """
+        Return a :class:`Progress` context manager for reporting the progress
+        of a long-running operation to this stream.
+        
+        :param label: A label describing the operation, e.g. ``'Scanned'``.
+        :return: The ``Progress`` instance.
+        """
+        
+        return Progress(self, label)
+    
     def write(self, msg, style=None, ending='\n'):
         
+        # Clear any interactive progress line before writing over it. It will
+        # be redrawn on its next update.
+        if _active_progress:
+            _active_progress.clear()
+        
+        style = style or self.default_style
+        if style == 'warning':
+            events.emit('warning', message=msg.strip())
+        
         if ending:
             msg += ending
         
-        style = style or self.default_style
         if style:
             msg = getattr(self.styler, style)(msg)
         
         self._out.write(msg)
+
+
+class Progress:
+    """
+    A context manager for reporting the progress of a long-running operation,
+    such as scanning a large number of files, to the given ``OutputWrapper``.
+    Call :meth:`update` as each item is processed. The number of items and
+    bytes processed, the throughput, and the elapsed time are reported:
+    
+    - on a single, continually updated line, if the stream is a terminal
+    - on a separate line every :attr:`log_interval` seconds, otherwise
+    
+    Redraws are throttled, so :meth:`update` can be called for every item
+    without adding noticeable overhead. A final summary line is written when
+    exiting the context.
+    
+    Usage::
+    
+        with stdout.progress('Scanned') as progress:
+            for path in paths:
+                progress.update(size=os.path.getsize(path))
+    
+    :param stdout: The ``OutputWrapper`` to report progress to.
+    :param label: A label describing the operation, e.g. ``'Scanned'``.
+    """
+    
+    #: The minimum number of seconds between redraws of an interactive
+    #: progress line.
+    redraw_interval = 0.1
+    
+    #: The number of seconds between progress lines written to a
+    #: non-interactive stream.
+    log_interval = 10
+    
+    def __init__(self, stdout, label):
+        
+        self.stdout = stdout
+        self.label = label
+        self.interactive = stdout.isatty()
+        
+        self.items = 0
+        self.bytes = 0
+        self.start = None
+        self.next_draw = None
+        self.drawn_length = 0
+    
+    def __enter__(self):
+        
+        global _active_progress
+        
+        _active_progress = self
+        
+        self.start = time.monotonic()
+        interval = self.redraw_interval if self.interactive else self.log_interval
+        self.next_draw = self.start + interval
+        
+        return self
+    
+    def __exit__(self, *args):
+        
+        global _active_progress
+        
+        self.clear()
+        _active_progress = None
+        
+        self.stdout.write(self.get_status(time.monotonic()))
+    
+    def get_status(self, now):
+        
+        elapsed = now - self.start
+        status = f'{self.label} {self.items:,} files ({format_size(self.bytes)})'
+        
+        if elapsed:
+            status = f'{status} at {format_size(self.bytes / elapsed)}/s'
+        
+        return f'{status}, {elapsed:.1f}s elapsed'
+    
+    def update(self, items=1, size=0):
+        """
+        Record the processing of the given number of ``items`` and bytes
+        (``size``), and redraw the progress report if it is due.
+        """
+        
+        self.items += items
+        self.bytes += size
+        
+        now = time.monotonic()
+        if now >= self.next_draw:
+            self.draw(now)
+    
+    def draw(self, now):
+        
+        status = self.get_status(now)
+        
+        if self.interactive:
+            # Overwrite the previous status, padding to clear any excess
+            self.stdout._out.write(f'\r{status.ljust(self.drawn_length)}')
+            self.stdout._out.flush()
+            self.drawn_length = len(status)
+            self.next_draw = now + self.redraw_interval
+        else:
+            self.stdout._out.write(f'{status}\n')
+            self.next_draw = now + self.log_interval
+    
+    def clear(self):
+        """
+        Clear the interactive progress line, if one has been drawn.
+        """
+        
+        if self.drawn_length:
+            self.stdout._out.write(f'\r{" " * self.drawn_length}\r')
+            self.drawn_length = 0
+
+
+class OutputBuffer:
+    """
+    Collects output destined for one or more streams, to be written to them
+    later, in the order it was written. Useful for running code concurrently
+    while still displaying its output as a single, contiguous block.
+    
+    Usage::
+    
+        buffer = OutputBuffer()
+        out = OutputWrapper(buffer.get_stream(sys.stdout))
+        err = OutputWrapper(buffer.get_stream(sys.stderr))
+        
+        # ... write to `out` and `err`, in any thread ...
+        
+        buffer.flush()  # write everything to sys.stdout/sys.stderr
+    """
+    
+    def __init__(self):
+        
+        self._chunks = []
+        self._lock = threading.Lock()
+    
+    def get_stream(self, target):
+        """
+        Return a text stream that buffers anything written to it, to be
+        written to the ``target`` stream when the buffer is flushed.
+        """
+        
+        return BufferedStream(self, target)
+    
+    def write(self, target, text):
+        
+        with self._lock:
+            self._chunks.append((target, text))
+    
+    def flush(self):
+        """
+        Write all buffered output to its target stream/s, and clear the
+        buffer.
+        """
+        
+        with self._lock:
+            chunks = self._chunks
+            self._chunks = []
+        
+        targets = []
+        for target, text in chunks:
+            target.write(text)
+            if target not in targets:
+                targets.append(target)
+        
+        for target in targets:
+            target.flush()
+
+
+class BufferedStream(TextIOBase):
+    """
+    A text stream that writes to an :class:`OutputBuffer`, destined for the
+    given ``target`` stream. It has no file descriptor, so output from
+    commands executed via :meth:`~jogger.tasks.base.Task.cli` is piped
+    through it.
+    """
+    
+    def __init__(self, buffer, target):
+        
+        self._buffer = buffer
+        self.target = target
+    
+    @property
+    def name(self):
+        
+        return getattr(self.target, 'name', None)
+    
+    def writable(self):
+        
+        return True
+    
+    def write(self, text):
+        
+        self._buffer.write(self.target, text)
+        
+        return len(text)
@@ -0,0 +1,263 @@
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+
+from .output import format_size
+
+DEFAULT_PROFILE_LIMIT = 30
+DEFAULT_MEMORY_PROFILE_LIMIT = 10
+
+# The MemoryProfiler instance currently tracing memory allocations, if any.
+# Like tracemalloc itself, only one can be active per process.
+_active_memory_profiler = None
+
+
+def get_function_label(func):
+    """
+    Return a readable label for the ``func`` key used in ``pstats`` data, a
+    tuple of ``(filename, line number, function name)``.
+    """
+    
+    filename, lineno, name = func
+    
+    if filename == '~' and not lineno:
+        # A builtin, the name is already descriptive, e.g. "<built-in method ...>"
+        return name
+    
+    return f'{name} ({os.path.basename(filename)}:{lineno})'
+
+
+def memory_checkpoint(label):
+    """
+    Record a named snapshot of traced memory allocations, if memory profiling
+    is enabled (e.g. via ``jog --memprofile``). Each checkpoint is compared to
+    the one before it in the final report. Do nothing if memory profiling is
+    not enabled.
+    
+    :param label: A label identifying the checkpoint in the report.
+    """
+    
+    if _active_memory_profiler:
+        _active_memory_profiler.checkpoint(label)
+
+
+def collapse_stats(stats):
+    """
+    Convert the raw ``stats`` dictionary of a ``pstats.Stats`` object into a
+    dictionary of "collapsed" stacks, suitable for generating flame graphs.
+    Keys are semicolon-separated call stacks, values are the time spent in
+    the last function of the stack itself, in microseconds.
+    
+    ``cProfile`` only records caller/callee pairs, not complete stacks, so the
+    stacks are reconstructed by walking the call graph from its roots and
+    distributing each function's time among its callers in proportion to the
+    time recorded against each caller.
+    
+    :param stats: The ``stats`` attribute of a ``pstats.Stats`` object.
+    :return: A dictionary mapping collapsed stacks to times.
+    """
+    
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, cumulative))
+    
+    collapsed = {}
+    
+    def visit(func, stack, stack_funcs, cumulative):
+        
+        # Prune branches too small to register (< 1 microsecond). As well as
+        # being insignificant, this limits the number of paths explored in
+        # large call graphs.
+        _, _, total, func_cumulative, _ = stats[func]
+        if not func_cumulative or cumulative < 0.000001:
+            return
+        
+        scale = cumulative / func_cumulative
+        stack = (*stack, get_function_label(func))
+        key = ';'.join(stack)
+        
+        collapsed[key] = collapsed.get(key, 0) + total * scale * 1000000
+        
+        for callee, callee_cumulative in callees.get(func, ()):
+            # Ignore recursive calls, their time is already accounted for by
+            # the cumulative time of the outer call
+            if callee in stack_funcs:
+                continue
+            
+            visit(callee, stack, stack_funcs | {callee}, callee_cumulative * scale)
+    
+    # Roots are functions called from outside the profiled code, i.e. by a
+    # caller that was already executing when profiling began. Such calls are
+    # either recorded against a caller that has no stats of its own, or not
+    # recorded against any caller at all. Only the proportion of time spent
+    # in those calls is attributed to the root stack.
+    for func, (primitive_calls, calls, _, cumulative, callers) in stats.items():
+        profiled_calls = sum(c[0] for caller, c in callers.items() if caller in stats)
+        external_calls = calls - profiled_calls
+        if external_calls > 0:
+            visit(func, (), {func}, cumulative * min(external_calls / primitive_calls, 1))
+    
+    return {k: round(v) for k, v in collapsed.items() if round(v)}
+
+
+class TaskProfiler:
+    """
+    A context manager that profiles the code executed within it using
+    ``cProfile``. After exiting the context, use :meth:`report` to output
+    the results.
+    
+    :param limit: The number of entries to include in the printed report.
+    :param stats_path: An optional path to write the raw profile data to, in
+        the ``pstats`` format. Can be loaded by ``pstats`` or visualisation
+        tools such as ``snakeviz``.
+    :param collapsed_path: An optional path to write the profile data to, in
+        the "collapsed stack" format used by flame graph tools such as
+        ``flamegraph.pl`` and ``speedscope``.
+    """
+    
+    def __init__(self, limit=DEFAULT_PROFILE_LIMIT, stats_path=None, collapsed_path=None):
+        
+        self.limit = limit
+        self.stats_path = stats_path
+        self.collapsed_path = collapsed_path
+        self.profiler = cProfile.Profile()
+    
+    def __enter__(self):
+        
+        self.profiler.enable()
+        
+        return self
+    
+    def __exit__(self, *args):
+        
+        self.profiler.disable()
+    
+    def report(self, stdout):
+        """
+        Write the top entries of the profile, sorted by cumulative time, to
+        the given ``OutputWrapper``. Also write the profile data to any
+        configured output files.
+        """
+        
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.limit)
+        
+        stdout.write('\nProfile (cProfile)', style='label')
+        stdout.write(stream.getvalue().strip('\n'))
+        
+        if self.stats_path:
+            stats.dump_stats(self.stats_path)
+            stdout.write(f'Profile data written to: {self.stats_path}')
+        
+        if self.collapsed_path:
+            collapsed = collapse_stats(stats.stats)
+            with open(self.collapsed_path, 'w') as f:
+                for stack, value in collapsed.items():
+                    f.write(f'{stack} {value}\n')
+            
+            stdout.write(f'Collapsed stacks written to: {self.collapsed_path}')
+
+
+class MemoryProfiler:
+    """
+    A context manager that traces memory allocations made by the code
+    executed within it using ``tracemalloc``. After exiting the context, use
+    :meth:`report` to output the results.
+    
+    While active, named snapshots can be recorded using
+    :func:`memory_checkpoint`.
+    
+    :param limit: The number of allocation sites to include in each section
+        of the printed report.
+    """
+    
+    # Allocations made by the profiling machinery itself are not of interest
+    filters = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    )
+    
+    def __init__(self, limit=DEFAULT_MEMORY_PROFILE_LIMIT):
+        
+        self.limit = limit
+        self.checkpoints = []
+        self.peak = 0
+        self.snapshot = None
+    
+    def __enter__(self):
+        
+        global _active_memory_profiler
+        
+        if _active_memory_profiler:
+            raise RuntimeError('Memory profiling is already active.')
+        
+        _active_memory_profiler = self
+        tracemalloc.start()
+        
+        return self
+    
+    def __exit__(self, *args):
+        
+        global _active_memory_profiler
+        
+        self.snapshot = self.take_snapshot()
+        self.peak = tracemalloc.get_traced_memory()[1]
+        
+        tracemalloc.stop()
+        _active_memory_profiler = None
+    
+    def take_snapshot(self):
+        
+        return tracemalloc.take_snapshot().filter_traces(self.filters)
+    
+    def checkpoint(self, label):
+        """
+        Record a snapshot of traced memory allocations under the given label.
+        """
+        
+        current, peak = tracemalloc.get_traced_memory()
+        self.checkpoints.append((label, self.take_snapshot(), current, peak))
+    
+    def write_stats(self, stdout, stats):
+        
+        if not stats:
+            stdout.write('No allocations recorded')
+        
+        for stat in stats[:self.limit]:
+            stdout.write(str(stat))
+    
+    def report(self, stdout):
+        """
+        Write the peak traced memory, the top allocation sites still holding
+        memory when profiling ended, and the differences between each recorded
+        checkpoint, to the given ``OutputWrapper``.
+        """
+        
+        stdout.write('\nMemory profile (tracemalloc)', style='label')
+        stdout.write(f'Peak traced memory: {format_size(self.peak)}')
+        
+        previous_label = None
+        previous_snapshot = None
+        for label, snapshot, current, peak in self.checkpoints:
+            stdout.write(f'\nCheckpoint "{label}"', style='label')
+            stdout.write(f'Traced memory: {format_size(current)} (peak: {format_size(peak)})')
+            
+            if previous_snapshot:
+                stdout.write(f'Top differences since "{previous_label}":')
+                self.write_stats(stdout, snapshot.compare_to(previous_snapshot, 'lineno'))
+            else:
+                stdout.write('Top allocation sites:')
+                self.write_stats(stdout, snapshot.statistics('lineno'))
+            
+            previous_label = label
+            previous_snapshot = snapshot
+        
+        stdout.write('\nTop allocation sites at exit:', style='label')
+        self.write_stats(stdout, self.snapshot.statistics('lineno'))
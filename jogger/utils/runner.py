@@ -0,0 +1,186 @@
+import json
+import os
+import re
+import sys
+import time
+import unittest
+from collections import defaultdict
+
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+from .failures import RESULTS_ENV_VAR
+from .shards import DURATIONS_ENV_VAR, SHARD_ENV_VAR
+
+#
+# A Django test runner for use with TestTask. It must be enabled via the
+# TEST_RUNNER setting of the Django project, and is only importable if Django
+# is installed.
+#
+
+
+class RecordingResultMixin:
+    """
+    A mixin for ``unittest`` result classes that records the total duration
+    of the tests in each test module, and the IDs of the tests that failed
+    and passed.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        
+        super().__init__(*args, **kwargs)
+        
+        self.module_durations = defaultdict(float)
+        self.failed_tests = set()
+        self.passed_tests = set()
+        self._test_started = None
+        self._duration_added = False
+    
+    def record_duration(self, test, elapsed):
+        
+        # Ignore placeholders for errors that occur outside of tests, e.g.
+        # when importing a test module
+        if isinstance(test, unittest.TestCase):
+            self.module_durations[test.__class__.__module__] += elapsed
+    
+    def record_failure(self, test):
+        
+        if isinstance(test, unittest.TestCase):
+            # Placeholders for modules that failed to import are named after
+            # the module, but not necessarily using its full dotted path, so
+            # cannot be rerun in isolation
+            if test.__class__.__module__ != 'unittest.loader':
+                self.failed_tests.add(test.id())
+        else:
+            # Placeholders for errors in class or module fixtures are
+            # described as e.g. "setUpClass (myapp.tests.MyTestCase)"
+            match = re.search(r'\(([\w.]+)\)$', str(test))
+            if match:
+                self.failed_tests.add(match.group(1))
+    
+    def startTest(self, test):
+        
+        super().startTest(test)
+        
+        self._test_started = time.perf_counter()
+        self._duration_added = False
+    
+    def addDuration(self, test, elapsed):
+        
+        # Python 3.12+ reports the duration of each test directly. This is
+        # also reported for tests run in parallel subprocesses.
+        super().addDuration(test, elapsed)
+        
+        self._duration_added = True
+        self.record_duration(test, elapsed)
+    
+    def stopTest(self, test):
+        
+        super().stopTest(test)
+        
+        if not self._duration_added and self._test_started is not None:
+            self.record_duration(test, time.perf_counter() - self._test_started)
+        
+        self._test_started = None
+    
+    def addError(self, test, err):
+        
+        super().addError(test, err)
+        
+        self.record_failure(test)
+    
+    def addFailure(self, test, err):
+        
+        super().addFailure(test, err)
+        
+        self.record_failure(test)
+    
+    def addUnexpectedSuccess(self, test):
+        
+        super().addUnexpectedSuccess(test)
+        
+        self.record_failure(test)
+    
+    def addSubTest(self, test, subtest, err):
+        
+        super().addSubTest(test, subtest, err)
+        
+        if err is not None:
+            self.record_failure(test)
+    
+    def addSuccess(self, test):
+        
+        super().addSuccess(test)
+        
+        self.passed_tests.add(test.id())
+
+
+class RecordingRunnerMixin:
+    """
+    A mixin for Django test runner classes that supports the sharding and
+    failure tracking features of :class:`~jogger.tasks.TestTask`:
+    
+    * Records the duration of each test module, used to balance shards.
+    * Gives each shard run via ``--shards`` its own test databases.
+    * Records the tests that failed, used by ``--last-failed`` and
+      ``--failed-first``.
+    """
+    
+    def get_resultclass(self):
+        
+        resultclass = super().get_resultclass() or unittest.TextTestResult
+        
+        return type('RecordingResult', (RecordingResultMixin, resultclass), {})
+    
+    def setup_databases(self, **kwargs):
+        
+        # Shards of a suite run concurrently, so must not share databases
+        shard = os.environ.get(SHARD_ENV_VAR)
+        if shard:
+            for alias in connections:
+                connection = connections[alias]
+                test_settings = connection.settings_dict['TEST']
+                name = test_settings.get('NAME')
+                
+                # In-memory SQLite databases are not shared anyway
+                if connection.vendor == 'sqlite' and not name:
+                    continue
+                
+                if not name:
+                    name = f'test_{connection.settings_dict["NAME"]}'
+                
+                test_settings['NAME'] = f'{name}_shard{shard}'
+        
+        return super().setup_databases(**kwargs)
+    
+    def run_suite(self, suite, **kwargs):
+        
+        result = super().run_suite(suite, **kwargs)
+        
+        # Before Python 3.12, tests run in parallel subprocesses have no
+        # meaningful duration in the main process
+        parallel = getattr(self, 'parallel', 1) > 1 and sys.version_info < (3, 12)
+        
+        path = os.environ.get(DURATIONS_ENV_VAR)
+        if path and not parallel:
+            with open(path, 'w') as f:
+                json.dump(dict(result.module_durations), f)
+        
+        # Outcomes of tests run in parallel subprocesses are also reported to
+        # the main process
+        path = os.environ.get(RESULTS_ENV_VAR)
+        if path:
+            with open(path, 'w') as f:
+                json.dump({
+                    'failed': sorted(result.failed_tests),
+                    'passed': sorted(result.passed_tests - result.failed_tests)
+                }, f)
+        
+        return result
+
+
+class RecordingRunner(RecordingRunnerMixin, DiscoverRunner):
+    """
+    Django's default test runner, with the features of
+    :class:`RecordingRunnerMixin`.
+    """
@@ -0,0 +1,133 @@
+import heapq
+import os
+import zlib
+from fnmatch import fnmatch
+
+from .files import atomic_write_json, read_json
+
+DURATIONS_FILE_NAME = 'test_durations.json'
+DEFAULT_TEST_PATTERN = 'test*.py'
+
+# Environment variables used to communicate with the test runner in the
+# test process. See jogger.utils.runner.
+DURATIONS_ENV_VAR = 'JOGGER_TEST_DURATIONS'
+SHARD_ENV_VAR = 'JOGGER_TEST_SHARD'
+
+
+def _find_test_modules(directory, package, pattern):
+    
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            # Like unittest's discovery, only descend into packages
+            if os.path.exists(os.path.join(entry.path, '__init__.py')):
+                yield from _find_test_modules(entry.path, f'{package}{entry.name}.', pattern)
+        elif fnmatch(entry.name, pattern) and entry.name.endswith('.py'):
+            name = entry.name[:-3]
+            if name.isidentifier():
+                yield f'{package}{name}'
+
+
+def discover_test_modules(labels=None, pattern=DEFAULT_TEST_PATTERN):
+    """
+    Return the dotted names of all test modules found under the current
+    working directory, in the same way as the test discovery of Django's
+    ``manage.py test``: modules matching ``pattern``, within packages.
+    Modules are found statically, without importing them.
+    
+    :param labels: An optional list of test labels, as accepted by
+        ``manage.py test``, to limit discovery to. Each must be the dotted
+        path or file path of a package, directory or module.
+    :param pattern: The file name pattern test modules must match.
+    :return: A sorted list of dotted module names.
+    """
+    
+    if not labels:
+        return sorted(_find_test_modules('.', '', pattern))
+    
+    modules = set()
+    for label in labels:
+        path = label if os.path.exists(label) else label.replace('.', os.sep)
+        path = os.path.normpath(path)
+        
+        if os.path.isdir(path):
+            package = '' if path == '.' else f'{path.replace(os.sep, ".")}.'
+            modules.update(_find_test_modules(path, package, pattern))
+        elif os.path.isfile(f'{path}.py') or (path.endswith('.py') and os.path.isfile(path)):
+            modules.add(path.removesuffix('.py').replace(os.sep, '.'))
+        else:
+            raise ValueError(
+                f'Test label "{label}" is not supported. Only packages, '
+                f'directories and modules can be used.'
+            )
+    
+    return sorted(modules)
+
+
+def load_durations(path):
+    """
+    Return a dictionary mapping the dotted names of test modules to the
+    duration (in seconds) of their tests, as recorded in the JSON file at
+    the given path. Return an empty dictionary if the file does not exist
+    or cannot be read.
+    """
+    
+    return read_json(path, dict) or {}
+
+
+def save_durations(path, durations):
+    """
+    Write the given dictionary of test module durations to the JSON file at
+    the given path. The file is replaced atomically, so concurrent readers
+    never see it partially written.
+    """
+    
+    atomic_write_json(path, durations, indent=0, sort_keys=True)
+
+
+def split_modules(modules, count, durations=None):
+    """
+    Split the given test modules into ``count`` shards, deterministically.
+    
+    If any of the modules have a known duration, the shards are balanced
+    such that their total durations are as even as possible. Each module is
+    assigned, longest first, to the shard with the lowest total duration so
+    far. Modules without a known duration are assumed to take the average
+    duration of those with one. Otherwise, modules are assigned based on a
+    hash of their name.
+    
+    Splitting the same modules, using the same durations, always produces
+    the same shards.
+    
+    :param modules: An iterable of dotted module names.
+    :param count: The number of shards.
+    :param durations: An optional dictionary mapping module names to their
+        duration, in seconds.
+    :return: A list of ``count`` sorted lists of module names.
+    """
+    
+    modules = sorted(set(modules))
+    shards = [[] for _ in range(count)]
+    
+    durations = durations or {}
+    known = [durations[module] for module in modules if module in durations]
+    
+    if not known:
+        for module in modules:
+            shards[zlib.crc32(module.encode('utf-8')) % count].append(module)
+        
+        return shards
+    
+    default = sum(known) / len(known)
+    weighted = sorted(modules, key=lambda m: (-durations.get(m, default), m))
+    
+    # Track the total duration of each shard, breaking ties by shard index
+    totals = [(0, index) for index in range(count)]
+    for module in weighted:
+        total, index = heapq.heappop(totals)
+        shards[index].append(module)
+        heapq.heappush(totals, (total + durations.get(module, default), index))
+    
+    return [sorted(shard) for shard in shards]
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+
+from . import events
+
+# The event data used to name the slices of each type of span
+SPAN_NAMES = {
+    'task': 'task',
+    'step': 'step',
+    'command': 'command',
+}
+
+# Event data that is either redundant in a trace or used to construct the
+# trace event itself, and should not be included in its arguments
+IGNORED_DATA = ('event', 'time', 'thread', 'thread_name')
+
+
+class TraceRecorder:
+    """
+    A context manager that records events emitted while it is active and
+    converts them to the Chrome trace event format. The resulting JSON file
+    can be loaded into ``chrome://tracing`` or the Perfetto UI
+    (https://ui.perfetto.dev) to view a timeline of the spans recorded, e.g.
+    tasks and the commands they execute. Spans from different threads are
+    displayed on separate tracks.
+    
+    :param path: The path to write the trace file to.
+    """
+    
+    def __init__(self, path):
+        
+        self.path = path
+        self.pid = os.getpid()
+        self.trace_events = []
+        self.threads = {}
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        
+        events.add_listener(self)
+        
+        return self
+    
+    def __exit__(self, *args):
+        
+        events.remove_listener(self)
+    
+    def __call__(self, event):
+        
+        kind, _, phase = event['event'].rpartition('_')
+        
+        if phase == 'start' and kind in SPAN_NAMES:
+            phase = 'B'
+        elif phase == 'end' and kind in SPAN_NAMES:
+            phase = 'E'
+        else:
+            # Not part of a span, display as an "instant" event
+            kind = event['event']
+            phase = 'i'
+        
+        name = str(event.get(SPAN_NAMES.get(kind), kind))
+        args = {k: v for k, v in event.items() if k not in IGNORED_DATA}
+        
+        trace_event = {
+            'name': name,
+            'cat': kind,
+            'ph': phase,
+            'ts': round(event['time'] * 1000000),
+            'pid': self.pid,
+            'tid': self.get_thread_id(event),
+            'args': args
+        }
+        
+        if phase == 'i':
+            trace_event['s'] = 't'  # scope the instant event to the thread
+        
+        with self._lock:
+            self.trace_events.append(trace_event)
+    
+    def get_thread_id(self, event):
+        """
+        Return a small, sequential identifier for the thread that emitted the
+        given event. The first thread to emit an event is given an identifier
+        of ``1``. Also record metadata naming the thread's track.
+        """
+        
+        ident = event['thread']
+        
+        with self._lock:
+            try:
+                return self.threads[ident]
+            except KeyError:
+                tid = self.threads[ident] = len(self.threads) + 1
+                
+                self.trace_events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': self.pid,
+                    'tid': tid,
+                    'args': {'name': event['thread_name']}
+                })
+                
+                return tid
+    
+    def report(self, stdout):
+        """
+        Write the recorded trace to the configured file and note its location
+        on the given ``OutputWrapper``.
+        """
+        
+        with open(self.path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events, 'displayTimeUnit': 'ms'}, f)
+        
+        stdout.write(f'\nTrace written to: {self.path}')